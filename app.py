@@ -2,21 +2,116 @@ import os
 import uuid
 import yaml
 import requests
-import shutil
 import json
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
+import io
+import base64
+import bisect
+import sqlite3
+import threading
+import hashlib
+import tempfile
+import copy
+import time
+import re
+import mimetypes
+import mmap
+import fcntl
+import struct
+import abc
+import contextlib
+import gzip
+import zlib
+import difflib
+import socket
+from collections import namedtuple
+from concurrent.futures import (ThreadPoolExecutor, Future, wait,
+                                as_completed, FIRST_COMPLETED)
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlparse, quote
 from minio import Minio
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from minio.error import S3Error
+from PIL import Image, ImageOps
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool
+from urllib3.poolmanager import PoolManager
+from urllib3.util import Retry, Timeout
+from werkzeug.exceptions import (BadRequest, InternalServerError,
+                                 RequestEntityTooLarge, UnsupportedMediaType)
+from werkzeug.security import safe_join
+from werkzeug.utils import cached_property
+from flask import (Flask, Request, Response, render_template, request, jsonify,
+                   send_file, send_from_directory, stream_with_context,
+                   redirect, abort, g, has_app_context)
+
+# 优先使用 libyaml 提供的 C 实现，未安装时回退到纯 Python 版本
+try:
+    from yaml import CSafeLoader as YamlLoader, CSafeDumper as YamlDumper
+except ImportError:
+    from yaml import SafeLoader as YamlLoader, SafeDumper as YamlDumper
+
+# 可选的 Brotli 压缩，未安装时只提供 gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 异步服务模式 (gunicorn gevent worker) 下，网络 I/O 已被 gevent 变为协作式；
+# 管道读写与 CPU 密集的工作需要显式地交给 gevent，避免阻塞整个事件循环。
+try:
+    import gevent
+    import gevent.os
+    from gevent import monkey as gevent_monkey
+except ImportError:
+    gevent = None
+
+
+def running_under_gevent():
+    return gevent is not None and gevent_monkey.is_module_patched('socket')
+
+
+def run_blocking(fn, *args):
+    """执行 CPU 密集或阻塞的函数；在 gevent 下放到其原生线程池中运行。"""
+    if running_under_gevent():
+        return gevent.get_hub().threadpool.apply(fn, args)
+    return fn(*args)
+
+
+def make_pipe():
+    read_fd, write_fd = os.pipe()
+    if running_under_gevent():
+        gevent.os.make_nonblocking(read_fd)
+        gevent.os.make_nonblocking(write_fd)
+    return read_fd, write_fd
+
+
+def pipe_read(fd, size):
+    if running_under_gevent():
+        return gevent.os.nb_read(fd, size)
+    return os.read(fd, size)
+
+
+def pipe_write(fd, data):
+    view = memoryview(data)
+    while view:
+        if running_under_gevent():
+            written = gevent.os.nb_write(fd, view)
+        else:
+            written = os.write(fd, view)
+        view = view[written:]
+
 
 # homepage 配置文件路径
-HOMEPAGE_CONFIG_PATH = '/app/homepage/config/services.yaml'
-HOMEPAGE_SETTINGS_PATH = '/app/homepage/config/settings.yaml'
-HOMEPAGE_BOOKMARKS_PATH = '/app/homepage/config/bookmarks.yaml'
+HOMEPAGE_CONFIG_DIR = os.getenv('HOMEPAGE_CONFIG_DIR', '/app/homepage/config')
+HOMEPAGE_CONFIG_PATH = os.path.join(HOMEPAGE_CONFIG_DIR, 'services.yaml')
+HOMEPAGE_SETTINGS_PATH = os.path.join(HOMEPAGE_CONFIG_DIR, 'settings.yaml')
+HOMEPAGE_BOOKMARKS_PATH = os.path.join(HOMEPAGE_CONFIG_DIR, 'bookmarks.yaml')
 
-UPLOAD_FOLDER = '/tmp/homepage-tool-uploads'
-LOCAL_ICON_PATH = '/app/data/icons'
-LOCAL_BACKGROUND_PATH = '/app/data/backgrounds'
+# 本服务自己的数据目录 (图标、背景、索引、缩略图等)
+DATA_DIR = os.getenv('DATA_DIR', '/app/data')
+LOCAL_ICON_PATH = os.path.join(DATA_DIR, 'icons')
+LOCAL_BACKGROUND_PATH = os.path.join(DATA_DIR, 'backgrounds')
 
 app = Flask(__name__, static_folder='static', static_url_path='/static')
 app.secret_key = 'a_very_secure_and_random_secret_key_that_you_should_change'
@@ -34,6 +129,13 @@ MINIO_ICONS_BUCKET_NAME = os.getenv('MINIO_ICONS_BUCKET_NAME', 'icons')
 MINIO_BACKGROUND_BUCKET_NAME = os.getenv('MINIO_BACKGROUND_BUCKET_NAME',
                                          'background')
 
+# 上传大小限制
+MAX_BACKGROUND_UPLOAD_BYTES = int(os.getenv('MAX_BACKGROUND_UPLOAD_MB',
+                                            '20')) * 1024 * 1024
+MAX_ICON_UPLOAD_BYTES = int(os.getenv('MAX_ICON_UPLOAD_MB', '2')) * 1024 * 1024
+app.config['MAX_CONTENT_LENGTH'] = max(MAX_BACKGROUND_UPLOAD_BYTES,
+                                       MAX_ICON_UPLOAD_BYTES) + 1024 * 1024
+
 # Docker API 配置
 DOCKER_API_ENDPOINT = os.getenv('DOCKER_API_ENDPOINT')
 
@@ -50,24 +152,324 @@ if MINIO_ENDPOINT and ICON_STORAGE_STRATEGY == 'minio':
 if LUCKY_API_ENDPOINT and LUCKY_API_TOKEN:
     print("Lucky API 配置已加载。")
 
+# 指标: 每个 worker 在内存中累计直方图与计数器，定期写入 METRICS_DIR 下各自的快照文件，
+# /metrics 合并所有 worker 的快照后以 Prometheus 文本格式输出。
+# 开启 SERVER_TIMING 后，各阶段耗时会附加在响应的 Server-Timing 头中，可在浏览器开发者工具查看。
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() != 'false'
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(DATA_DIR, 'metrics'))
+METRICS_FLUSH_INTERVAL = int(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'false').lower() == 'true'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+                   30)
+METRIC_TYPES = {
+    'homepage_http_request_duration_seconds':
+    ('histogram', 'HTTP 请求处理耗时'),
+    'homepage_http_requests_total': ('counter', 'HTTP 请求数'),
+    'homepage_stage_duration_seconds': ('histogram', '请求内各处理阶段耗时'),
+    'homepage_outbound_request_duration_seconds':
+    ('histogram', '对外请求耗时 (按目标)'),
+    'homepage_outbound_requests_total': ('counter', '对外请求数 (按目标与结果)'),
+}
+
+_metrics = {}
+_metrics_lock = threading.Lock()
+_metrics_owner = None
+
+
+def _metrics_snapshot_path():
+    return os.path.join(METRICS_DIR, f"{_metrics_owner[1]}.json")
+
+
+def _flush_metrics():
+    if _metrics_owner is None or _metrics_owner[0] != os.getpid():
+        return
+    with _metrics_lock:
+        samples = [[name, list(labels), value]
+                   for (name, labels), value in _metrics.items()]
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        path = _metrics_snapshot_path()
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(samples, f)
+        os.replace(f"{path}.tmp", path)
+    except OSError as e:
+        print(f"写入指标快照失败: {e}")
+
+
+def _metrics_flusher():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        _flush_metrics()
+
+
+def _ensure_metrics_owner():
+    """fork 后的新 worker 使用独立的快照文件并重新启动刷新线程。"""
+    global _metrics_owner
+    pid = os.getpid()
+    if _metrics_owner is not None and _metrics_owner[0] == pid:
+        return
+    with _metrics_lock:
+        if _metrics_owner is not None and _metrics_owner[0] == pid:
+            return
+        _metrics.clear()
+        _metrics_owner = (pid, f"{pid}-{uuid.uuid4().hex[:8]}")
+    threading.Thread(target=_metrics_flusher,
+                     name='metrics-flush',
+                     daemon=True).start()
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def observe(name, value, **labels):
+    """记录一次直方图观测值 (秒)。"""
+    if not METRICS_ENABLED:
+        return
+    _ensure_metrics_owner()
+    key = (name, _labels_key(labels))
+    index = bisect.bisect_left(LATENCY_BUCKETS, value)
+    with _metrics_lock:
+        # [各桶计数 (非累计)..., +Inf 桶, 总和, 次数]
+        histogram = _metrics.get(key)
+        if histogram is None:
+            histogram = _metrics[key] = [0] * (len(LATENCY_BUCKETS) + 3)
+        histogram[index] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+
+def inc(name, amount=1, **labels):
+    if not METRICS_ENABLED:
+        return
+    _ensure_metrics_owner()
+    key = (name, _labels_key(labels))
+    with _metrics_lock:
+        _metrics[key] = _metrics.get(key, 0) + amount
+
+
+def _record_server_timing(stage, seconds):
+    if SERVER_TIMING and has_app_context():
+        g.setdefault('server_timing', []).append((stage, seconds))
+
+
+@contextlib.contextmanager
+def timed(stage):
+    """统计一个处理阶段的耗时。"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        observe('homepage_stage_duration_seconds', elapsed, stage=stage)
+        _record_server_timing(stage, elapsed)
+
+
+def record_outbound(target, start, outcome):
+    elapsed = time.perf_counter() - start
+    observe('homepage_outbound_request_duration_seconds',
+            elapsed,
+            target=target)
+    inc('homepage_outbound_requests_total', target=target, outcome=outcome)
+    _record_server_timing(f"outbound_{target}", elapsed)
+
+
+def _status_outcome(status):
+    return 'ok' if status < 400 else f"{status // 100}xx"
+
+
+class InstrumentedSession(requests.Session):
+    """记录每个请求的耗时与结果，target 区分 docker/lucky/websites 等对外目标。"""
+
+    def __init__(self, target):
+        super().__init__()
+        self.target = target
+
+    def send(self, request, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = super().send(request, **kwargs)
+        except Exception:
+            record_outbound(self.target, start, 'error')
+            raise
+        record_outbound(self.target, start,
+                        _status_outcome(response.status_code))
+        return response
+
+
+class InstrumentedPoolManager(PoolManager):
+    """供 MinIO 客户端使用的连接池，记录对 MinIO 的请求。"""
+
+    def urlopen(self, method, url, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = super().urlopen(method, url, *args, **kwargs)
+        except Exception:
+            record_outbound('minio', start, 'error')
+            raise
+        record_outbound('minio', start, _status_outcome(response.status))
+        return response
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"'
+                          for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def collect_metrics():
+    """合并所有 worker 的快照 (包括已退出 worker 的计数，保证计数器单调)。"""
+    _flush_metrics()
+    merged = {}
+    try:
+        names = [n for n in os.listdir(METRICS_DIR) if n.endswith('.json')]
+    except FileNotFoundError:
+        names = []
+    for filename in names:
+        try:
+            with open(os.path.join(METRICS_DIR, filename)) as f:
+                samples = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, labels, value in samples:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            if isinstance(value, list):
+                current = merged.setdefault(key, [0] * len(value))
+                merged[key] = [a + b for a, b in zip(current, value)]
+            else:
+                merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def render_metrics(merged):
+    lines = []
+    for name, (metric_type, help_text) in METRIC_TYPES.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for (sample_name, labels), value in sorted(merged.items()):
+            if sample_name != name:
+                continue
+            if metric_type == 'counter':
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf', ), value):
+                cumulative += count
+                lines.append(
+                    f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}"
+                )
+            lines.append(f"{name}_sum{_format_labels(labels)} {value[-2]}")
+            lines.append(f"{name}_count{_format_labels(labels)} {value[-1]}")
+    return '\n'.join(lines) + '\n'
+
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def _record_request_metrics(response):
+    started = g.get('request_started')
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    observe('homepage_http_request_duration_seconds',
+            elapsed,
+            route=route,
+            method=request.method)
+    inc('homepage_http_requests_total',
+        route=route,
+        method=request.method,
+        status=str(response.status_code))
+    if SERVER_TIMING:
+        entries = [
+            f"{stage};dur={seconds * 1000:.1f}"
+            for stage, seconds in g.get('server_timing', [])
+        ]
+        entries.append(f"total;dur={elapsed * 1000:.1f}")
+        response.headers.add('Server-Timing', ', '.join(entries))
+    return response
+
+
+@app.route('/metrics')
+def metrics():
+    if not METRICS_ENABLED:
+        abort(404)
+    return Response(render_metrics(collect_metrics()),
+                    mimetype='text/plain; version=0.0.4')
+
+
+# 静态文件缓存: 按内容哈希 (或 UUID) 命名的文件永不改变，可以长期缓存；
+# 可选交给前置代理发送文件内容 ('x-sendfile' 或 'x-accel')，Python 只处理 API。
+STATIC_OFFLOAD = os.getenv('STATIC_OFFLOAD', '').lower()
+X_ACCEL_PREFIX = os.getenv('X_ACCEL_PREFIX', '/_protected').rstrip('/')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+_IMMUTABLE_NAME = re.compile(
+    r'^(?P<digest>[0-9a-f]{16,64})(?:-|\.)|'
+    r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}[-_.]')
+if STATIC_OFFLOAD == 'x-sendfile':
+    app.config['USE_X_SENDFILE'] = True
+    print("静态文件将通过 X-Sendfile 交给前置代理发送。")
+elif STATIC_OFFLOAD == 'x-accel':
+    print(f"静态文件将通过 X-Accel-Redirect ({X_ACCEL_PREFIX}) 交给前置代理发送。")
+
+
+def serve_stored_file(kind, directory, filename):
+    """发送本地存储的图片，附带缓存头、强 ETag，并支持条件请求与 Range。"""
+    match = _IMMUTABLE_NAME.match(os.path.basename(filename))
+    if STATIC_OFFLOAD == 'x-accel':
+        path = safe_join(directory, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        response = Response(mimetype=mimetypes.guess_type(path)[0]
+                            or 'application/octet-stream')
+        response.headers[
+            'X-Accel-Redirect'] = f"{X_ACCEL_PREFIX}/{kind}/{quote(filename)}"
+    else:
+        etag = match.group('digest') if match and match.group(
+            'digest') else True
+        response = send_from_directory(directory,
+                                       filename,
+                                       etag=etag,
+                                       max_age=IMMUTABLE_MAX_AGE
+                                       if match else None)
+    if match:
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    # 旧版本可能保存过非图片文件，禁止浏览器嗅探类型或执行其中的脚本
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    response.headers['Content-Security-Policy'] = (
+        "default-src 'none'; style-src 'unsafe-inline'; sandbox")
+    return response
+
+
 # 注册本地图标服务 API
 if ICON_STORAGE_STRATEGY == 'local':
 
     @app.route('/icons/<path:filename>')
     def serve_icon(filename):
-        return send_from_directory(LOCAL_ICON_PATH, filename)
+        return serve_stored_file('icons', LOCAL_ICON_PATH, filename)
 
     print("本地图标服务 API (/icons) 已启用。")
 
     @app.route('/backgrounds/<path:filename>')
     def serve_background(filename):
-        return send_from_directory(LOCAL_BACKGROUND_PATH, filename)
+        return serve_stored_file('backgrounds', LOCAL_BACKGROUND_PATH,
+                                 filename)
 
     print("本地背景服务 API (/backgrounds) 已启用。")
 else:
     print("由于存储策略不是 'local'，本地文件服务 API (/icons, /backgrounds) 已被禁用。")
 
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(LOCAL_ICON_PATH, exist_ok=True)
 os.makedirs(LOCAL_BACKGROUND_PATH, exist_ok=True)
 
@@ -77,370 +479,2554 @@ if MINIO_ENDPOINT and ICON_STORAGE_STRATEGY == 'minio':
     try:
         minio_pure_endpoint = urlparse(
             MINIO_ENDPOINT).netloc or MINIO_ENDPOINT.split('//')[-1]
-        minio_client = Minio(minio_pure_endpoint,
-                             access_key=MINIO_ACCESS_KEY,
-                             secret_key=MINIO_SECRET_KEY,
-                             secure=False)
+        # 与 minio 默认的连接池参数一致，只是增加了请求统计
+        minio_client = Minio(
+            minio_pure_endpoint,
+            access_key=MINIO_ACCESS_KEY,
+            secret_key=MINIO_SECRET_KEY,
+            secure=False,
+            http_client=InstrumentedPoolManager(
+                timeout=Timeout(connect=300, read=300),
+                maxsize=10,
+                retries=Retry(total=5,
+                              backoff_factor=0.2,
+                              status_forcelist=[500, 502, 503, 504])))
         print("MinIO 客户端初始化成功 (使用HTTP连接)。")
     except Exception as e:
         print(f"致命错误: 无法连接到 MinIO。请检查您的 MINIO 环境变量。错误: {e}")
         minio_client = None
 
 
-def fetch_and_save_icon(url):
-    headers = {
-        'User-Agent':
-        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36'
-    }
-    temp_icon_path = None
-    try:
-        requests.packages.urllib3.disable_warnings(
-            requests.packages.urllib3.exceptions.InsecureRequestWarning)
-        parsed_url = urlparse(url)
-        favicon_ico_url = f"{parsed_url.scheme}://{parsed_url.netloc}/favicon.ico"
-        response = requests.get(favicon_ico_url,
-                                verify=False,
-                                timeout=5,
-                                headers=headers)
-        if response.status_code == 200 and 'image' in response.headers.get(
-                'Content-Type', '').lower():
-            filename = f"{uuid.uuid4()}.ico"
-            temp_icon_path = os.path.join(UPLOAD_FOLDER, filename)
-            with open(temp_icon_path, 'wb') as f:
-                f.write(response.content)
-            return temp_icon_path
-
-        page_response = requests.get(url,
-                                     verify=False,
-                                     timeout=10,
-                                     headers=headers)
-        page_response.raise_for_status()
-        soup = BeautifulSoup(page_response.text, 'html.parser')
-        icon_links = soup.find_all('link',
-                                   rel=lambda r: r and 'icon' in r.lower())
-        if not icon_links: return None
-        best_link = icon_links[-1].get('href')
-        if not best_link: return None
-        icon_url = urljoin(url, best_link)
-        icon_response = requests.get(icon_url,
-                                     verify=False,
-                                     timeout=10,
-                                     headers=headers)
-        icon_response.raise_for_status()
-        ext = os.path.splitext(urlparse(icon_url).path)[1] or '.png'
-        filename = f"{uuid.uuid4()}{ext}"
-        temp_icon_path = os.path.join(UPLOAD_FOLDER, filename)
-        with open(temp_icon_path, 'wb') as f:
-            f.write(icon_response.content)
-        return temp_icon_path
-    except Exception as e:
-        if temp_icon_path and os.path.exists(temp_icon_path):
-            os.remove(temp_icon_path)
-        return None
+# 多进程协调: gunicorn 的各个 worker 各自持有缓存。写入时递增共享内存 (mmap 文件)
+# 中的代数计数器，其他 worker 看到代数变化即重新检查文件；代数不变时，
+# 最多每 CONFIG_STAT_INTERVAL 秒 stat 一次以发现外部编辑。
+SHARED_STATE_PATH = os.getenv('SHARED_STATE_PATH',
+                              os.path.join(DATA_DIR, '.shared_state'))
+CONFIG_STAT_INTERVAL = float(os.getenv('CONFIG_STAT_INTERVAL', '2'))
+SHARED_GENERATION_SLOTS = ('config', 'backgrounds')
+_GENERATION_FORMAT = '<Q'
+_GENERATION_SIZE = struct.calcsize(_GENERATION_FORMAT)
 
 
-def save_file_locally(temp_path, destination_directory):
+def _open_shared_state():
     try:
-        filename = os.path.basename(temp_path)
-        permanent_path = os.path.join(destination_directory, filename)
-        shutil.copy2(temp_path, permanent_path)
-        return filename
-    except Exception as e:
-        print(f"保存文件到 {destination_directory} 时出错: {e}")
+        os.makedirs(os.path.dirname(SHARED_STATE_PATH), exist_ok=True)
+        fd = os.open(SHARED_STATE_PATH, os.O_RDWR | os.O_CREAT, 0o644)
+        size = _GENERATION_SIZE * len(SHARED_GENERATION_SLOTS)
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+        return fd, mmap.mmap(fd, size)
+    except OSError as e:
+        print(f"无法创建共享状态文件 {SHARED_STATE_PATH}，将在每次请求时检查配置文件: {e}")
+        return None, None
+
+
+_shared_state_fd, _shared_state = _open_shared_state()
+_shared_state_lock = threading.Lock()
+
+
+def shared_generation(slot):
+    """读取共享代数；共享状态不可用时返回 None。"""
+    if _shared_state is None:
         return None
+    return struct.unpack_from(
+        _GENERATION_FORMAT, _shared_state,
+        SHARED_GENERATION_SLOTS.index(slot) * _GENERATION_SIZE)[0]
 
 
-def upload_to_minio(file_path, bucket_name):
-    if not minio_client: return None
+def bump_shared_generation(slot):
+    """递增共享代数，通知所有 worker 对应的数据已经变化。"""
+    if _shared_state is None:
+        return
+    offset = SHARED_GENERATION_SLOTS.index(slot) * _GENERATION_SIZE
+    with _shared_state_lock:
+        fcntl.flock(_shared_state_fd, fcntl.LOCK_EX)
+        try:
+            value = struct.unpack_from(_GENERATION_FORMAT, _shared_state,
+                                       offset)[0]
+            struct.pack_into(_GENERATION_FORMAT, _shared_state, offset,
+                             value + 1)
+        finally:
+            fcntl.flock(_shared_state_fd, fcntl.LOCK_UN)
+
+
+# 串行化对配置文件的 "读取-修改-写入": 进程内用线程锁，进程间用同目录下
+# 旁路锁文件 (.<文件名>.lock) 上的 fcntl 排他锁。
+_config_thread_locks = {}
+_config_thread_locks_guard = threading.Lock()
+
+
+@contextlib.contextmanager
+def config_write_lock(path):
+    with _config_thread_locks_guard:
+        thread_lock = _config_thread_locks.setdefault(path, threading.Lock())
+    directory, basename = os.path.split(path)
+    with thread_lock:
+        fd = os.open(os.path.join(directory, f".{basename}.lock"),
+                     os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+
+# 配置存储: 以 (路径, mtime, 大小, inode) 为键缓存解析后的 YAML 文档，
+# 只有文件真正发生变化 (外部编辑、git pull 等) 时才重新解析。
+# 每个文档的修订号取自文件内容的哈希，用作 ETag 以检测并发修改。
+_yaml_cache = {}
+_derived_cache = {}
+_signature_checks = {}
+_yaml_cache_lock = threading.Lock()
+
+EMPTY_REVISION = hashlib.sha1(b'').hexdigest()[:16]
+
+
+def _file_signature(path):
+    st = os.stat(path)
+    return (path, st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def _file_signature_or_none(path):
     try:
-        object_prefix = "backgrounds/" if bucket_name == MINIO_BACKGROUND_BUCKET_NAME else "icons/"
-        object_name = f"{object_prefix}{uuid.uuid4()}_{os.path.basename(file_path)}"
-        minio_client.fput_object(bucket_name, object_name, file_path)
-        return f"{MINIO_PUBLIC_ENDPOINT.rstrip('/')}/{bucket_name}/{object_name}"
-    except Exception as e:
-        print(f"上传到 MinIO 失败: {e}")
+        return _file_signature(path)
+    except OSError:
         return None
 
 
-@app.route('/')
-def index():
-    return render_template('index.html')
+def _current_signature(path, fresh=False):
+    """返回文件签名；共享代数未变且距上次检查不足 CONFIG_STAT_INTERVAL 秒时
+    直接复用上次的结果，不再 stat。"""
+    generation = shared_generation('config')
+    now = time.monotonic()
+    checked = _signature_checks.get(path)
+    if (not fresh and generation is not None and checked
+            and checked[0] == generation
+            and now - checked[1] < CONFIG_STAT_INTERVAL):
+        return checked[2]
+    signature = _file_signature_or_none(path)
+    _signature_checks[path] = (generation, now, signature)
+    return signature
 
 
-@app.route('/api/settings', methods=['GET'])
-def get_settings():
+def _content_revision(raw):
+    return hashlib.sha1(raw).hexdigest()[:16]
+
+
+def load_yaml_revision(path, fresh=False):
+    """读取 YAML 文档及其修订号，命中缓存时直接返回已解析的对象。
+
+    返回的对象在多个请求间共享，调用方不得原地修改。文件不存在时抛出
+    FileNotFoundError。fresh=True 时总是重新 stat (用于读取-修改-写入)。
+    """
+    signature = _current_signature(path, fresh)
+    if signature is None:
+        raise FileNotFoundError(path)
+    cached = _yaml_cache.get(path)
+    if cached and cached[0] == signature:
+        return cached[1], cached[2]
+    with _yaml_cache_lock:
+        cached = _yaml_cache.get(path)
+        if cached and cached[0] == signature:
+            return cached[1], cached[2]
+        with timed('yaml_load'):
+            with open(path, 'rb') as f:
+                raw = f.read()
+            data = yaml.load(raw.decode('utf-8'), Loader=YamlLoader)
+        revision = _content_revision(raw)
+        _yaml_cache[path] = (signature, data, revision)
+        return data, revision
+
+
+def load_yaml(path):
+    return load_yaml_revision(path)[0]
+
+
+def dump_yaml(path, data, reason='save'):
+    """原子地写入 YAML 文档 (同目录临时文件 + rename)，返回新的修订号。
+
+    调用方应持有 config_write_lock(path)。reason 记录在历史版本中。
+    """
+    with timed('yaml_dump'):
+        raw = yaml.dump(data,
+                        Dumper=YamlDumper,
+                        allow_unicode=True,
+                        sort_keys=False,
+                        indent=2).encode('utf-8')
+        return write_document(path, raw, data, reason)
+
+
+def write_document(path, raw, data, reason):
+    """原子地写入已序列化的文档内容并记录历史版本，返回新的修订号。"""
+    directory, basename = os.path.split(path)
     try:
-        with open(HOMEPAGE_SETTINGS_PATH, 'r', encoding='utf-8') as f:
-            data = yaml.safe_load(f) or {}
-        return jsonify(data)
+        with open(path, 'rb') as f:
+            previous = f.read()
+            mode = os.fstat(f.fileno()).st_mode & 0o777
     except FileNotFoundError:
-        return jsonify({})
+        previous, mode = None, 0o644
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{basename}.")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(raw)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    revision = _content_revision(raw)
+    bump_shared_generation('config')
+    signature = _file_signature_or_none(path)
+    if signature:
+        with _yaml_cache_lock:
+            _yaml_cache[path] = (signature, data, revision)
+    try:
+        run_blocking(record_history, path, previous, raw, reason)
     except Exception as e:
-        return jsonify({"error": f"读取 settings.yaml 失败: {e}"}), 500
+        print(f"记录 {basename} 的历史版本失败: {e}")
+    return revision
 
 
-@app.route('/api/settings/background', methods=['POST'])
-def save_background_settings():
-    new_bg_data = request.get_json()
-    all_settings = {}
+def cached_derived(name, paths, builder, extra_key=None):
+    """缓存由若干配置文件派生出的数据，任一文件或 extra_key 变化时重新计算。"""
+    key = (extra_key, ) + tuple(_current_signature(p) for p in paths)
+    cached = _derived_cache.get(name)
+    if cached and cached[0] == key:
+        return cached[1]
+    value = builder()
+    _derived_cache[name] = (key, value)
+    return value
+
+
+# 增量修改: services.yaml 与 bookmarks.yaml 都是 "单键字典" 组成的列表，
+# 每个键 (服务组/书签列) 对应一个条目列表，条目以 [组索引, 条目索引] 定位。
+def _check_index(value, length, label):
+    if isinstance(value, bool) or not isinstance(value, int) or not (
+            0 <= value < length):
+        raise ValueError(f"{label}无效: {value}")
+    return value
+
+
+def _group_items(doc, group_index):
+    entry = doc[_check_index(group_index, len(doc), "组索引")]
+    if not isinstance(entry, dict) or len(entry) != 1:
+        raise ValueError(f"第 {group_index} 组的结构无效")
+    key = next(iter(entry))
+    if entry[key] is None:
+        entry[key] = []
+    return entry[key]
+
+
+def _item_position(value):
+    if not isinstance(value, (list, tuple)) or not 1 <= len(value) <= 2:
+        raise ValueError(f"条目位置无效: {value}")
+    return value[0], (value[1] if len(value) == 2 else None)
+
+
+def _single_key_dict(value, label):
+    if not isinstance(value, dict) or len(value) != 1:
+        raise ValueError(f"{label}必须是只有一个键的对象")
+    return value
+
+
+def apply_document_ops(doc, ops):
+    """在文档上依次执行增量操作并返回结果，操作非法时抛出 ValueError。"""
+    for op in ops:
+        kind = op.get('op') if isinstance(op, dict) else None
+        if kind == 'move_item':
+            from_group, from_index = _item_position(op.get('from'))
+            to_group, to_index = _item_position(op.get('to'))
+            source = _group_items(doc, from_group)
+            item = source.pop(_check_index(from_index, len(source), "条目索引"))
+            target = _group_items(doc, to_group)
+            if to_index is None: to_index = len(target)
+            target.insert(_check_index(to_index, len(target) + 1, "条目索引"),
+                          item)
+        elif kind == 'insert_item':
+            group, index = _item_position(op.get('to'))
+            items = _group_items(doc, group)
+            if index is None: index = len(items)
+            items.insert(_check_index(index, len(items) + 1, "条目索引"),
+                         _single_key_dict(op.get('item'), "条目"))
+        elif kind == 'replace_item':
+            group, index = _item_position(op.get('at'))
+            items = _group_items(doc, group)
+            items[_check_index(index, len(items),
+                               "条目索引")] = _single_key_dict(
+                                   op.get('item'), "条目")
+        elif kind == 'delete_item':
+            group, index = _item_position(op.get('at'))
+            items = _group_items(doc, group)
+            items.pop(_check_index(index, len(items), "条目索引"))
+        elif kind == 'insert_group':
+            name, items = op.get('name'), op.get('items') or []
+            if not isinstance(name, str) or not name or not isinstance(
+                    items, list):
+                raise ValueError("insert_group 需要组名和条目列表")
+            for item in items:
+                _single_key_dict(item, "条目")
+            index = op.get('index', len(doc))
+            doc.insert(_check_index(index, len(doc) + 1, "组索引"),
+                       {name: items})
+        elif kind == 'rename_group':
+            name = op.get('name')
+            if not isinstance(name, str) or not name:
+                raise ValueError("rename_group 需要新的组名")
+            index = op.get('index')
+            items = _group_items(doc, index)
+            doc[index] = {name: items}
+        elif kind == 'move_group':
+            group = doc.pop(_check_index(op.get('from'), len(doc), "组索引"))
+            doc.insert(_check_index(op.get('to'), len(doc) + 1, "组索引"),
+                       group)
+        elif kind == 'delete_group':
+            doc.pop(_check_index(op.get('index'), len(doc), "组索引"))
+        else:
+            raise ValueError(f"未知的操作类型: {kind}")
+    return doc
+
+
+def _document_response(payload, revision):
+    response = jsonify(payload)
+    response.set_etag(revision)
+    return response
+
+
+# 文档读取响应: 每个文档只缓存当前修订号的 JSON 正文及其压缩版本 (按需生成)，
+# 以修订号作为强 ETag，未变化时返回 304，命中缓存时无需重新序列化和压缩。
+# 不同内容编码的正文字节不同，强 ETag 也必须不同: 压缩后的响应使用 "<修订号>-gzip"
+# 或 "<修订号>-br"，比较 If-None-Match / If-Match 时去掉后缀再与修订号比较。
+COMPRESS_MIN_BYTES = 1024
+ENCODING_ETAG_SUFFIXES = ('-gzip', '-br')
+_encoded_documents = {}
+_encoded_documents_lock = threading.Lock()
+
+
+def _encoded_etag(revision, encoding):
+    return revision if encoding == 'identity' else f"{revision}-{encoding}"
+
+
+def etags_match_revision(etags, revision):
+    """判断 If-Match / If-None-Match 中是否有 (任意编码的) 强 ETag 对应该修订号。"""
+    if etags.star_tag:
+        return True
+    for etag in etags:
+        for suffix in ENCODING_ETAG_SUFFIXES:
+            if etag.endswith(suffix):
+                etag = etag[:-len(suffix)]
+                break
+        if etag == revision:
+            return True
+    return False
+
+
+def _preferred_encoding():
+    if brotli is not None and request.accept_encodings['br']:
+        return 'br'
+    if request.accept_encodings['gzip']:
+        return 'gzip'
+    return 'identity'
+
+
+def _encoded_document(path, revision, data, encoding):
+    with _encoded_documents_lock:
+        cached = _encoded_documents.get(path)
+        if not cached or cached[0] != revision:
+            body = app.json.dumps(data, separators=(',', ':')).encode('utf-8')
+            cached = _encoded_documents[path] = (revision, {'identity': body})
+        bodies = cached[1]
+    if len(bodies['identity']) < COMPRESS_MIN_BYTES:
+        encoding = 'identity'
+    if encoding not in bodies:
+        # 压缩在锁外进行，并发请求最多重复压缩一次
+        if encoding == 'br':
+            bodies['br'] = brotli.compress(bodies['identity'], quality=9)
+        else:
+            bodies['gzip'] = gzip.compress(bodies['identity'], 9, mtime=0)
+    return bodies[encoding], encoding
+
+
+def _cached_document_response(path, revision, data):
+    body, encoding = _encoded_document(path, revision, data,
+                                       _preferred_encoding())
+    if etags_match_revision(request.if_none_match, revision):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(_encoded_etag(revision, encoding))
+    response.vary.add('Accept-Encoding')
+    response.cache_control.no_cache = True
+    return response
+
+
+def _load_document(path, filename, default):
     try:
-        with open(HOMEPAGE_SETTINGS_PATH, 'r', encoding='utf-8') as f:
-            all_settings = yaml.safe_load(f) or {}
+        data, revision = load_yaml_revision(path)
+        return _cached_document_response(path, revision, data or default)
     except FileNotFoundError:
-        pass
-    all_settings['background'] = new_bg_data
-    try:
-        with open(HOMEPAGE_SETTINGS_PATH, 'w', encoding='utf-8') as f:
-            yaml.dump(all_settings,
-                      f,
-                      allow_unicode=True,
-                      sort_keys=False,
-                      indent=2)
-        return jsonify({"message": "背景设置已成功保存！"})
+        return _cached_document_response(path, EMPTY_REVISION, default)
     except Exception as e:
-        return jsonify({"error": f"写入 settings.yaml 失败: {e}"}), 500
+        return jsonify({"error": f"读取 {filename} 失败: {e}"}), 500
 
 
-@app.route('/api/backgrounds', methods=['GET'])
-def list_backgrounds():
-    if ICON_STORAGE_STRATEGY == 'minio':
-        if not minio_client: return jsonify({"error": "MinIO 未配置"}), 500
-        try:
-            if not minio_client.bucket_exists(MINIO_BACKGROUND_BUCKET_NAME):
-                print(f"MinIO 存储桶 '{MINIO_BACKGROUND_BUCKET_NAME}' 不存在。")
-                return jsonify([])
-            objects = minio_client.list_objects(MINIO_BACKGROUND_BUCKET_NAME,
-                                                recursive=True)
-            image_urls = [{
-                "url":
-                f"{MINIO_PUBLIC_ENDPOINT.rstrip('/')}/{MINIO_BACKGROUND_BUCKET_NAME}/{obj.object_name}",
-                "name": obj.object_name
-            } for obj in objects]
-            return jsonify(image_urls)
-        except Exception as e:
-            return jsonify({"error": f"从 MinIO 列出背景失败: {e}"}), 500
-    elif ICON_STORAGE_STRATEGY == 'local':
-        try:
-            if not os.path.exists(LOCAL_BACKGROUND_PATH): return jsonify([])
-            files = os.listdir(LOCAL_BACKGROUND_PATH)
-            image_urls = [{
-                "url": f"/backgrounds/{f}",
-                "name": f
-            } for f in files]
-            return jsonify(image_urls)
-        except Exception as e:
-            return jsonify({"error": f"从本地列出背景失败: {e}"}), 500
-    return jsonify([])
+def _load_document_for_update(path):
+    try:
+        return load_yaml_revision(path, fresh=True)
+    except FileNotFoundError:
+        return None, EMPTY_REVISION
 
 
-@app.route('/api/backgrounds/upload', methods=['POST'])
-def upload_background():
-    if 'file' not in request.files: return jsonify({"error": "请求中没有文件部分"}), 400
-    file = request.files['file']
-    if file.filename == '': return jsonify({"error": "没有选择文件"}), 400
-    temp_file_path = None
+def _replace_document(path, filename, message):
     try:
-        filename = f"{uuid.uuid4()}-{os.path.basename(file.filename)}"
-        temp_file_path = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(temp_file_path)
-        final_url = None
-        if ICON_STORAGE_STRATEGY == 'minio':
-            final_url = upload_to_minio(temp_file_path,
-                                        MINIO_BACKGROUND_BUCKET_NAME)
-            if not final_url: raise Exception("上传背景到 MinIO 失败")
-        elif ICON_STORAGE_STRATEGY == 'local':
-            local_filename = save_file_locally(temp_file_path,
-                                               LOCAL_BACKGROUND_PATH)
-            if local_filename: final_url = f"/backgrounds/{local_filename}"
-            else: raise Exception("保存背景到本地失败")
-        return jsonify({"message": "背景上传成功", "url": final_url})
+        with config_write_lock(path):
+            _, revision = _load_document_for_update(path)
+            if request.if_match and not etags_match_revision(
+                    request.if_match, revision):
+                return jsonify({
+                    "error": f"{filename} 已被其他编辑者修改，请刷新后重试",
+                    "revision": revision
+                }), 412
+            revision = dump_yaml(path, request.get_json())
+        return _document_response({
+            "message": message,
+            "revision": revision
+        }, revision)
     except Exception as e:
-        return jsonify({"error": f"处理上传文件时出错: {e}"}), 500
-    finally:
-        if temp_file_path and os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
+        return jsonify({"error": f"写入 {filename} 失败: {e}"}), 500
 
 
-@app.route('/api/docker/containers', methods=['GET'])
-def get_docker_containers():
-    if not DOCKER_API_ENDPOINT:
-        return jsonify({"error": "Docker API 端点未配置"}), 500
+def _patch_document(path, filename, message):
+    body = request.get_json(silent=True)
+    ops = body.get('ops') if isinstance(body, dict) else None
+    if not isinstance(ops, list) or not ops:
+        return jsonify({"error": "请求中缺少 ops 操作列表"}), 400
+    if not request.if_match:
+        return jsonify({"error": "增量修改需要 If-Match 修订号"}), 428
     try:
-        api_url = f"{DOCKER_API_ENDPOINT.rstrip('/')}/containers/json?all=true"
-        response = requests.get(api_url, timeout=10)
-        response.raise_for_status()
-        containers_data = response.json()
-        docker_host = urlparse(DOCKER_API_ENDPOINT).hostname
-        simplified_containers = []
-        for c in containers_data:
-            name = c.get('Names', ['/无名称'])[0].lstrip('/')
-            ports_info = c.get('Ports', [])
-            suggested_urls = []
-            processed_public_ports = set()
-            sorted_ports = sorted(
-                ports_info,
-                key=lambda p:
-                (p.get('PrivatePort') not in [80, 443, 8080, 8000, 3000],
-                 p.get('PrivatePort')))
-            for p in sorted_ports:
-                public_port = p.get('PublicPort')
-                if public_port and p.get(
-                        'Type'
-                ) == 'tcp' and public_port not in processed_public_ports:
-                    suggested_urls.append(
-                        f"http://{docker_host}:{public_port}")
-                    processed_public_ports.add(public_port)
-            simplified_containers.append({
-                'Id': c.get('Id')[:12],
-                'Name': name,
-                'Image': c.get('Image'),
-                'State': c.get('State'),
-                'suggested_urls': suggested_urls
-            })
-        return jsonify(simplified_containers)
-    except requests.exceptions.RequestException as e:
-        return jsonify({"error": f"连接 Docker API 失败: {e}"}), 500
+        with config_write_lock(path):
+            data, revision = _load_document_for_update(path)
+            if not etags_match_revision(request.if_match, revision):
+                return jsonify({
+                    "error": f"{filename} 已被其他编辑者修改，请刷新后重试",
+                    "revision": revision
+                }), 412
+            new_doc = apply_document_ops(copy.deepcopy(data or []), ops)
+            revision = dump_yaml(path, new_doc, reason='edit')
+        return _document_response({
+            "message": message,
+            "revision": revision
+        }, revision)
+    except ValueError as e:
+        return jsonify({"error": f"无效的修改操作: {e}"}), 400
     except Exception as e:
-        return jsonify({"error": f"获取 Docker 容器列表时发生错误: {e}"}), 500
+        return jsonify({"error": f"写入 {filename} 失败: {e}"}), 500
 
 
-@app.route('/api/lucky/proxies', methods=['GET'])
-def get_lucky_proxies():
-    """获取 Lucky 反向代理规则列表 (V4 - 增加内网地址)"""
-    if not (LUCKY_API_ENDPOINT and LUCKY_API_TOKEN):
-        return jsonify({"error": "Lucky API 端点或Token未在环境变量中配置"}), 500
+# 图标发现: 在同一个截止时间内并发探测 /favicon.ico、页面 <head> 中的
+# <link rel=icon>、apple-touch-icon 以及 manifest 中的图标，
+# 通过共享的连接池复用到同一主机的 keep-alive 连接，返回最先可用的结果。
+ICON_FETCH_DEADLINE = float(os.getenv('ICON_FETCH_DEADLINE', '8'))
+ICON_FETCH_WORKERS = int(os.getenv('ICON_FETCH_WORKERS', '16'))
+ICON_MAX_BYTES = 1024 * 1024
+HTML_HEAD_MAX_BYTES = 256 * 1024
 
-    headers = {
-        'openToken': LUCKY_API_TOKEN,
-        'User-Agent': 'Homepage-Web-Editor/1.0'
-    }
+ICON_CONTENT_TYPES = {
+    'image/x-icon': '.ico',
+    'image/vnd.microsoft.icon': '.ico',
+    'image/png': '.png',
+    'image/svg+xml': '.svg',
+    'image/jpeg': '.jpg',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+}
+ICON_EXTENSIONS = set(ICON_CONTENT_TYPES.values())
 
-    try:
-        api_url = f"{LUCKY_API_ENDPOINT.rstrip('/')}/api/webservice/rules"
-        response = requests.get(api_url, headers=headers, timeout=10)
-        response.raise_for_status()
-        lucky_data = response.json()
-
-        all_rules = []
-        if isinstance(lucky_data.get('ruleList'), list):
-            for rule_group in lucky_data['ruleList']:
-                if isinstance(rule_group.get('ProxyList'), list):
-                    all_rules.extend(rule_group['ProxyList'])
-
-        if not all_rules:
-            error_msg = "在Lucky API的响应中未能找到任何'ProxyList'。"
-            print(
-                f"[DEBUG] {error_msg} 完整响应: {json.dumps(lucky_data, indent=2, ensure_ascii=False)}"
-            )
-            return jsonify({"error": error_msg}), 500
-
-        simplified_proxies = []
-        for rule in all_rules:
-            if (rule.get('Enable') and rule.get('Domains')
-                    and isinstance(rule.get('Domains'), list)
-                    and rule['Domains'] and rule.get('Locations')
-                    and isinstance(rule.get('Locations'), list)
-                    and rule['Locations']):
-
-                domain = rule['Domains'][0]
-                name = rule.get('Remark') or domain
-                full_url = f"https://{domain}"
-                lan_url = rule['Locations'][0]
-
-                simplified_proxies.append({
-                    'Name': name,
-                    'Url': full_url,
-                    'LanUrl': lan_url
-                })
-        return jsonify(simplified_proxies)
+# 抓取到的图标及其来源地址与缓存校验信息 (用于之后的条件请求)
+FetchedIcon = namedtuple('FetchedIcon',
+                         'content ext source_url etag last_modified')
+ICON_NOT_MODIFIED = 'not-modified'
 
-    except requests.exceptions.RequestException as e:
-        return jsonify({"error": f"连接 Lucky API 失败: {e}"}), 500
-    except Exception as e:
-        return jsonify({"error": f"处理 Lucky 数据时发生错误: {e}"}), 500
+requests.packages.urllib3.disable_warnings(
+    requests.packages.urllib3.exceptions.InsecureRequestWarning)
 
+http_session = InstrumentedSession('websites')
+http_session.verify = False
+http_session.headers['User-Agent'] = (
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+    '(KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36')
+_http_adapter = HTTPAdapter(pool_connections=64,
+                            pool_maxsize=ICON_FETCH_WORKERS)
+http_session.mount('http://', _http_adapter)
+http_session.mount('https://', _http_adapter)
 
-@app.route('/api/config', methods=['GET'])
-def get_config():
-    layout = {}
-    all_groups = set()
+icon_executor = ThreadPoolExecutor(max_workers=ICON_FETCH_WORKERS,
+                                   thread_name_prefix='icon-fetch')
+
+
+class _HeadLinkParser(HTMLParser):
+    """只解析 <head>，收集图标与 manifest 链接，遇到 </head> 或 <body> 即停止。"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.base_href = None
+        self.icons = []
+        self.touch_icons = []
+        self.manifests = []
+        self.done = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'body':
+            self.done = True
+            return
+        attrs = dict(attrs)
+        if tag == 'base' and attrs.get('href') and not self.base_href:
+            self.base_href = attrs['href']
+        if tag != 'link' or not attrs.get('href'):
+            return
+        rel = (attrs.get('rel') or '').lower().split()
+        if 'apple-touch-icon' in rel or 'apple-touch-icon-precomposed' in rel:
+            self.touch_icons.append(attrs['href'])
+        elif 'icon' in rel:
+            self.icons.append(attrs['href'])
+        elif 'manifest' in rel:
+            self.manifests.append(attrs['href'])
+
+    def handle_endtag(self, tag):
+        if tag == 'head':
+            self.done = True
+
+
+def _remaining(deadline):
+    return deadline - time.monotonic()
+
+
+def _request_timeout(deadline):
+    remaining = max(_remaining(deadline), 0.1)
+    return (min(3.0, remaining), remaining)
+
+
+def _fetch_icon_candidate(icon_url, deadline, headers=None):
+    """下载单个候选图标，返回 FetchedIcon；内容不是图片或超出大小限制时返回 None。
+
+    传入条件请求头且服务器返回 304 时返回 ICON_NOT_MODIFIED。
+    """
     try:
-        with open(HOMEPAGE_SETTINGS_PATH, 'r', encoding='utf-8') as f:
-            settings_data = yaml.safe_load(f)
-            if settings_data and 'layout' in settings_data:
-                layout = settings_data['layout']
+        with http_session.get(icon_url,
+                              headers=headers,
+                              timeout=_request_timeout(deadline),
+                              stream=True) as response:
+            if response.status_code == 304 and headers:
+                return ICON_NOT_MODIFIED
+            if response.status_code != 200:
+                return None
+            content_type = response.headers.get('Content-Type', '').split(
+                ';')[0].strip().lower()
+            ext = ICON_CONTENT_TYPES.get(content_type)
+            if not ext:
+                path_ext = os.path.splitext(
+                    urlparse(icon_url).path)[1].lower()
+                if 'image' in content_type:
+                    ext = path_ext if path_ext in ICON_EXTENSIONS else '.png'
+                elif path_ext in ICON_EXTENSIONS and 'html' not in content_type:
+                    ext = path_ext
+                else:
+                    return None
+            content = bytearray()
+            for chunk in response.iter_content(16 * 1024):
+                content.extend(chunk)
+                if len(content) > ICON_MAX_BYTES or _remaining(deadline) <= 0:
+                    return None
+            if not content:
+                return None
+            return FetchedIcon(bytes(content), ext, icon_url,
+                               response.headers.get('ETag'),
+                               response.headers.get('Last-Modified'))
     except Exception:
-        pass
+        return None
+
+
+def _discover_page_icons(page_url, deadline):
+    """流式读取页面直到 </head>，返回按优先级排列的 (类型, 地址) 候选列表。"""
     try:
-        with open(HOMEPAGE_CONFIG_PATH, 'r', encoding='utf-8') as f:
-            services_data = yaml.safe_load(f) or []
-            for group in services_data:
-                all_groups.add(list(group.keys())[0])
+        with http_session.get(page_url,
+                              timeout=_request_timeout(deadline),
+                              stream=True) as response:
+            response.raise_for_status()
+            parser = _HeadLinkParser()
+            received = 0
+            encoding = response.encoding or 'utf-8'
+            for chunk in response.iter_content(8 * 1024):
+                received += len(chunk)
+                parser.feed(chunk.decode(encoding, errors='ignore'))
+                if parser.done or received >= HTML_HEAD_MAX_BYTES:
+                    break
+            base_url = urljoin(response.url, parser.base_href or '')
     except Exception:
-        pass
+        return []
+    candidates = [('icon', urljoin(base_url, href))
+                  for href in reversed(parser.icons)]
+    candidates += [('icon', urljoin(base_url, href))
+                   for href in reversed(parser.touch_icons)]
+    candidates += [('manifest', urljoin(base_url, href))
+                   for href in parser.manifests[:1]]
+    return candidates
+
+
+def _discover_manifest_icons(manifest_url, deadline):
     try:
-        with open(HOMEPAGE_BOOKMARKS_PATH, 'r', encoding='utf-8') as f:
-            bookmarks_data = yaml.safe_load(f) or []
-            for column in bookmarks_data:
-                all_groups.add(list(column.keys())[0])
+        response = http_session.get(manifest_url,
+                                    timeout=_request_timeout(deadline))
+        response.raise_for_status()
+        icons = response.json().get('icons') or []
     except Exception:
-        pass
-    return jsonify({'groups': sorted(list(all_groups)), 'layout': layout})
+        return []
 
+    def icon_size(icon):
+        sizes = [
+            int(s.split('x')[0]) for s in str(icon.get('sizes', '')).split()
+            if s.split('x')[0].isdigit()
+        ]
+        return max(sizes) if sizes else 0
 
-@app.route('/api/services', methods=['GET'])
-def get_services():
+    icons = [i for i in icons if isinstance(i, dict) and i.get('src')]
+    icons.sort(key=icon_size, reverse=True)
+    return [('icon', urljoin(manifest_url, i['src'])) for i in icons[:3]]
+
+
+def resolve_icon(url, timeout=None):
+    """并发探测网站图标，返回 FetchedIcon，在截止时间内没有结果则返回 None。"""
+    parsed_url = urlparse(url)
+    if parsed_url.scheme not in ('http', 'https') or not parsed_url.netloc:
+        return None
+    deadline = time.monotonic() + (timeout or ICON_FETCH_DEADLINE)
+    origin = f"{parsed_url.scheme}://{parsed_url.netloc}"
+    seen = set()
+    pending = set()
+    discovery = set()
+
+    def probe(icon_url):
+        if icon_url not in seen:
+            seen.add(icon_url)
+            pending.add(
+                icon_executor.submit(_fetch_icon_candidate, icon_url,
+                                     deadline))
+
+    def discover(fn, target):
+        future = icon_executor.submit(fn, target, deadline)
+        discovery.add(future)
+        pending.add(future)
+
+    probe(f"{origin}/favicon.ico")
+    discover(_discover_page_icons, url)
+    probe(f"{origin}/apple-touch-icon.png")
     try:
-        with open(HOMEPAGE_CONFIG_PATH, 'r', encoding='utf-8') as f:
-            data = yaml.safe_load(f) or []
-        return jsonify(data)
-    except FileNotFoundError:
-        return jsonify([])
-    except Exception as e:
-        return jsonify({"error": f"读取 services.yaml 失败: {e}"}), 500
+        while pending and _remaining(deadline) > 0:
+            done, _ = wait(pending,
+                           timeout=_remaining(deadline),
+                           return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                if future in discovery:
+                    for kind, target in future.result():
+                        if kind == 'manifest':
+                            discover(_discover_manifest_icons, target)
+                        else:
+                            probe(target)
+                elif future.result():
+                    return future.result()
+        return None
+    finally:
+        for future in pending:
+            future.cancel()
 
 
-@app.route('/api/services', methods=['POST'])
-def save_services():
+def _url_origin(url):
+    parsed_url = urlparse(url)
+    return f"{parsed_url.scheme}://{parsed_url.netloc}".lower()
+
+
+# 图标存储: 图标按内容哈希命名，相同的图标只保存一次；
+# 同时在 SQLite 中持久化 "站点 → 图标" 的解析结果 (包括未找到图标的负缓存)，
+# 已知站点无需再次访问网络。
+ICON_INDEX_PATH = os.getenv('ICON_INDEX_PATH',
+                            os.path.join(DATA_DIR, 'icon_index.sqlite3'))
+ICON_INDEX_TTL = int(os.getenv('ICON_INDEX_TTL', str(7 * 24 * 3600)))
+ICON_NEGATIVE_TTL = int(os.getenv('ICON_NEGATIVE_TTL', str(24 * 3600)))
+ICON_EXTENSION_TYPES = {
+    '.ico': 'image/x-icon',
+    '.png': 'image/png',
+    '.svg': 'image/svg+xml',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp',
+    '.bmp': 'image/bmp',
+    '.tiff': 'image/tiff',
+    '.avif': 'image/avif',
+    '.heic': 'image/heic',
+}
+_icon_index_local = threading.local()
+
+
+def _icon_index():
+    conn = getattr(_icon_index_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(ICON_INDEX_PATH, timeout=10)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS icon_index ('
+                     'origin TEXT PRIMARY KEY, icon_url TEXT, '
+                     'strategy TEXT NOT NULL, resolved_at REAL NOT NULL)')
+        # 旧版本创建的索引没有来源地址与缓存校验字段
+        columns = {
+            row[1]
+            for row in conn.execute('PRAGMA table_info(icon_index)')
+        }
+        for column in ('source_url', 'etag', 'last_modified'):
+            if column not in columns:
+                conn.execute(
+                    f'ALTER TABLE icon_index ADD COLUMN {column} TEXT')
+        _icon_index_local.conn = conn
+    return conn
+
+
+def lookup_icon_index(origin):
+    """查询站点的图标解析记录，返回 (是否命中, 图标地址)，负缓存命中时地址为 None。"""
+    row = _icon_index().execute(
+        'SELECT icon_url, strategy, resolved_at FROM icon_index '
+        'WHERE origin = ?', (origin, )).fetchone()
+    if not row or row[1] != ICON_STORAGE_STRATEGY:
+        return False, None
+    icon_url, _, resolved_at = row
+    ttl = ICON_INDEX_TTL if icon_url else ICON_NEGATIVE_TTL
+    if time.time() - resolved_at > ttl:
+        return False, None
+    if icon_url and icon_url.startswith('/icons/') and not os.path.exists(
+            os.path.join(LOCAL_ICON_PATH, icon_url[len('/icons/'):])):
+        return False, None
+    return True, icon_url
+
+
+def record_icon_index(origin, icon_url, fetched=None):
+    """记录站点的图标解析结果；fetched 为 FetchedIcon 时同时保存来源与校验信息。"""
+    with _icon_index() as conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO icon_index '
+            '(origin, icon_url, strategy, resolved_at, source_url, etag, '
+            'last_modified) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (origin, icon_url, ICON_STORAGE_STRATEGY, time.time(),
+             fetched.source_url if fetched else None,
+             fetched.etag if fetched else None,
+             fetched.last_modified if fetched else None))
+
+
+def icon_index_source(origin):
+    """返回 (图标地址, 来源地址, ETag, Last-Modified)，没有记录时返回 None。"""
+    return _icon_index().execute(
+        'SELECT icon_url, source_url, etag, last_modified FROM icon_index '
+        'WHERE origin = ? AND strategy = ?',
+        (origin, ICON_STORAGE_STRATEGY)).fetchone()
+
+
+def touch_icon_index(origin):
+    with _icon_index() as conn:
+        conn.execute(
+            'UPDATE icon_index SET resolved_at = ? WHERE origin = ?',
+            (time.time(), origin))
+
+
+def forget_icon_index_urls(icon_urls):
+    with _icon_index() as conn:
+        conn.executemany('DELETE FROM icon_index WHERE icon_url = ?',
+                         [(url, ) for url in icon_urls])
+
+
+def content_filename(content, ext):
+    return f"{hashlib.sha256(content).hexdigest()[:32]}{ext.lower()}"
+
+
+def store_icon_bytes(content, ext):
+    """按当前存储策略以内容哈希保存图标，已存在则直接复用，返回图标地址。"""
+    filename = content_filename(content, ext)
+    if ICON_STORAGE_STRATEGY == 'minio':
+        return upload_bytes_to_minio(
+            content, MINIO_ICONS_BUCKET_NAME, f"icons/{filename}",
+            ICON_EXTENSION_TYPES.get(ext.lower(), 'application/octet-stream'))
+    if ICON_STORAGE_STRATEGY != 'local':
+        print(f"警告: 未知策略 '{ICON_STORAGE_STRATEGY}'。将默认使用 'local'。")
+    permanent_path = os.path.join(LOCAL_ICON_PATH, filename)
     try:
-        with open(HOMEPAGE_CONFIG_PATH, 'w', encoding='utf-8') as f:
-            yaml.dump(request.get_json(),
-                      f,
-                      allow_unicode=True,
-                      sort_keys=False,
-                      indent=2)
-        return jsonify({"message": "服务配置已成功保存！"})
+        if not os.path.exists(permanent_path):
+            fd, temp_path = tempfile.mkstemp(dir=LOCAL_ICON_PATH,
+                                             prefix='.upload-')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(content)
+                os.chmod(temp_path, 0o644)
+                os.replace(temp_path, permanent_path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+        return f"/icons/{filename}"
     except Exception as e:
-        return jsonify({"error": f"写入 services.yaml 失败: {e}"}), 500
+        print(f"保存图标到 {LOCAL_ICON_PATH} 时出错: {e}")
+        return None
 
 
-@app.route('/api/bookmarks', methods=['GET'])
-def get_bookmarks():
+def fetch_and_store_icon(url, refresh=False):
+    """获取站点图标地址: 优先查询图标索引，未命中 (或 refresh=True) 时抓取并保存后写回索引。"""
+    origin = _url_origin(url)
     try:
-        with open(HOMEPAGE_BOOKMARKS_PATH, 'r', encoding='utf-8') as f:
-            data = yaml.safe_load(f) or []
-        return jsonify(data)
-    except FileNotFoundError:
-        return jsonify([])
-    except Exception as e:
-        return jsonify({"error": f"读取 bookmarks.yaml 失败: {e}"}), 500
+        with timed('icon_index_lookup'):
+            hit, icon_url = lookup_icon_index(origin)
+        if hit and not refresh:
+            return icon_url
+    except sqlite3.Error as e:
+        print(f"查询图标索引失败: {e}")
+    with timed('icon_resolve'):
+        result = resolve_icon(url)
+    with timed('icon_store'):
+        icon_url = store_icon_bytes(result.content,
+                                    result.ext) if result else None
+    if (result and not icon_url) or (refresh and not result):
+        # 存储失败不写入索引，下次重试；刷新失败时保留原有记录
+        return None
+    try:
+        record_icon_index(origin, icon_url, result)
+    except sqlite3.Error as e:
+        print(f"写入图标索引失败: {e}")
+    return icon_url
 
 
-@app.route('/api/bookmarks', methods=['POST'])
-def save_bookmarks():
+def upload_bytes_to_minio(content, bucket_name, object_name, content_type):
+    """上传内容到 MinIO，同名对象已存在时跳过上传 (用于按内容哈希命名的对象)。"""
+    if not minio_client: return None
     try:
-        with open(HOMEPAGE_BOOKMARKS_PATH, 'w', encoding='utf-8') as f:
-            yaml.dump(request.get_json(),
-                      f,
-                      allow_unicode=True,
-                      sort_keys=False,
-                      indent=2)
-        return jsonify({"message": "书签配置已成功保存！"})
+        with timed('minio_upload'):
+            try:
+                minio_client.stat_object(bucket_name, object_name)
+            except S3Error as e:
+                if e.code not in ('NoSuchKey', 'NoSuchObject'): raise
+                minio_client.put_object(bucket_name,
+                                        object_name,
+                                        io.BytesIO(content),
+                                        len(content),
+                                        content_type=content_type)
+        return f"{MINIO_PUBLIC_ENDPOINT.rstrip('/')}/{bucket_name}/{object_name}"
     except Exception as e:
-        return jsonify({"error": f"写入 bookmarks.yaml 失败: {e}"}), 500
+        print(f"上传到 MinIO 失败: {e}")
+        return None
 
 
-@app.route('/api/item/prepare', methods=['POST'])
+# 流式上传: multipart 中的文件在解析时直接写入最终存储 (本地同目录临时文件 + rename，
+# 或通过管道以分片方式 put_object 到 MinIO)，不再先落盘到 /tmp 再复制。
+# 写入过程中同时计算 SHA-256，并检查大小限制与文件内容是否为图片。
+MINIO_PART_SIZE = 10 * 1024 * 1024
+
+# 判断文件类型所需的开头字节数 (SVG 前面可能有 XML 声明、注释和 DOCTYPE)
+SNIFF_BYTES = 1024
+_IMAGE_SIGNATURES = ((b'\x89PNG\r\n\x1a\n', '.png'), (b'\xff\xd8\xff', '.jpg'),
+                     (b'GIF87a', '.gif'), (b'GIF89a', '.gif'), (b'BM', '.bmp'),
+                     (b'\x00\x00\x01\x00', '.ico'), (b'II*\x00', '.tiff'),
+                     (b'MM\x00*', '.tiff'))
+_SVG_PROLOG = re.compile(
+    rb'(?:\s+|<\?xml[^>]*\?>|<!--.*?-->|<!doctype\s+svg[^>\[]*>)*',
+    re.S | re.I)
+
+
+def sniff_image_type(head):
+    """根据文件开头的内容判断图片类型，返回扩展名；不是图片时返回 None。
+
+    扩展名只取决于内容，与客户端提供的文件名和类型无关。
+    """
+    for signature, ext in _IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return '.webp'
+    if head[4:8] == b'ftyp':
+        if head[8:12] in (b'avif', b'avis'):
+            return '.avif'
+        if head[8:12] in (b'heic', b'heix', b'mif1'):
+            return '.heic'
+    # 文本内容只接受根元素为 <svg 的 SVG
+    if head.startswith(b'\xef\xbb\xbf'):
+        head = head[3:]
+    rest = head[_SVG_PROLOG.match(head).end():]
+    if rest[:4].lower() == b'<svg' and rest[4:5] in (b' ', b'\t', b'\r',
+                                                     b'\n', b'>', b'/'):
+        return '.svg'
+    return None
+
+
+def _upload_basename(filename):
+    return os.path.basename((filename or '').replace('\\', '/')).lstrip(
+        '.') or 'upload'
+
+
+def _upload_stem(filename):
+    return os.path.splitext(_upload_basename(filename))[0] or 'upload'
+
+
+class EmptyUpload(BadRequest):
+    description = "上传的文件为空"
+
+
+# 上传被拒绝属于客户端错误，由 _upload_rejected 返回对应的 4xx 状态码
+UPLOAD_REJECTIONS = (EmptyUpload, RequestEntityTooLarge, UnsupportedMediaType)
+
+
+class UploadSink(abc.ABC):
+    """上传文件的写入目标，边接收边计算哈希并执行大小与类型检查。
+
+    开头的 SNIFF_BYTES 字节先缓存在内存中，确认是图片并得到扩展名 (ext) 之后
+    才交给子类写入存储。
+    """
+
+    def __init__(self, filename, max_bytes):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.ext = None
+        self.hasher = hashlib.sha256()
+        self._head = b''
+        self._closed = False
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise RequestEntityTooLarge(
+                f"文件超过大小限制 ({self.max_bytes // (1024 * 1024)} MB)")
+        self.hasher.update(data)
+        if self.ext is None:
+            self._head += data
+            if len(self._head) < SNIFF_BYTES:
+                return len(data)
+            data = self._sniff()
+        self._write(data)
+        return len(data)
+
+    def _sniff(self):
+        """确定扩展名，返回缓存的开头数据。"""
+        self.ext = sniff_image_type(self._head[:SNIFF_BYTES])
+        if self.ext is None:
+            raise UnsupportedMediaType("上传的文件不是有效的图片")
+        self._start()
+        head, self._head = self._head, b''
+        return head
+
+    @property
+    def content_type(self):
+        return ICON_EXTENSION_TYPES.get(self.ext, 'application/octet-stream')
+
+    def seek(self, offset, whence=0):
+        return 0
+
+    def tell(self):
+        return self.size
+
+    @property
+    def digest(self):
+        return self.hasher.hexdigest()
+
+    def commit(self):
+        if not self.size:
+            raise EmptyUpload()
+        if self.ext is None:
+            self._write(self._sniff())
+        self._closed = True
+        return self._finish()
+
+    def abort(self):
+        if not self._closed:
+            self._closed = True
+            self._discard()
+
+    def close(self):
+        self.abort()
+
+    def _start(self):
+        """已确认文件类型，即将开始写入。"""
+
+    @abc.abstractmethod
+    def _write(self, data):
+        """写入一段数据。"""
+
+    @abc.abstractmethod
+    def _finish(self):
+        """完成写入并返回结果 (内容或地址)。"""
+
+    def _discard(self):
+        pass
+
+
+class MemoryUploadSink(UploadSink):
+    """小文件 (图标) 保存在内存中，提交后交给按内容哈希命名的图标存储。"""
+
+    def __init__(self, filename, max_bytes):
+        super().__init__(filename, max_bytes)
+        self._buffer = bytearray()
+
+    def _write(self, data):
+        self._buffer.extend(data)
+
+    def _finish(self):
+        return bytes(self._buffer)
+
+
+class LocalUploadSink(UploadSink):
+    """写入目标目录中的临时文件，提交时以 "哈希前缀-原文件名" 原子地重命名。"""
+
+    def __init__(self, filename, max_bytes, directory, url_prefix):
+        super().__init__(filename, max_bytes)
+        self.directory = directory
+        self.url_prefix = url_prefix
+        fd, self._temp_path = tempfile.mkstemp(dir=directory,
+                                               prefix='.upload-')
+        self._file = os.fdopen(fd, 'wb')
+
+    def _write(self, data):
+        self._file.write(data)
+
+    def _finish(self):
+        try:
+            self._file.close()
+            name = f"{self.digest[:16]}-{_upload_stem(self.filename)}{self.ext}"
+            os.chmod(self._temp_path, 0o644)
+            os.replace(self._temp_path, os.path.join(self.directory, name))
+        except BaseException:
+            self._discard()
+            raise
+        return f"{self.url_prefix}/{name}"
+
+    def _discard(self):
+        self._file.close()
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+
+
+class _PipeReader:
+    """供 put_object 读取的管道端，上传被放弃时让读取失败以中止分片上传。"""
+
+    def __init__(self, fd):
+        self._fd = fd
+        self.aborted = False
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = MINIO_PART_SIZE
+        data = bytearray()
+        while len(data) < size:
+            chunk = pipe_read(self._fd, size - len(data))
+            if not chunk:
+                break
+            data.extend(chunk)
+        if self.aborted:
+            raise IOError("上传已取消")
+        return bytes(data)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class MinioUploadSink(UploadSink):
+    """通过管道把数据交给后台线程，以分片方式直接 put_object 到 MinIO。
+
+    确认文件类型后才开始上传，对象名为 object_prefix 加上内容对应的扩展名。
+    """
+
+    def __init__(self, filename, max_bytes, bucket_name, object_prefix):
+        super().__init__(filename, max_bytes)
+        self.bucket_name = bucket_name
+        self.object_prefix = object_prefix
+        self.object_name = None
+        self._write_fd = None
+        self._thread = None
+        self._error = None
+
+    def _start(self):
+        self.object_name = f"{self.object_prefix}{self.ext}"
+        read_fd, self._write_fd = make_pipe()
+        self._reader = _PipeReader(read_fd)
+        self._thread = threading.Thread(target=self._upload,
+                                        args=(self.content_type, ),
+                                        name='minio-upload',
+                                        daemon=True)
+        self._thread.start()
+
+    def _upload(self, content_type):
+        try:
+            minio_client.put_object(self.bucket_name,
+                                    self.object_name,
+                                    self._reader,
+                                    length=-1,
+                                    part_size=MINIO_PART_SIZE,
+                                    content_type=content_type)
+        except Exception as e:
+            self._error = e
+        finally:
+            self._reader.close()
+
+    def _write(self, data):
+        try:
+            pipe_write(self._write_fd, data)
+        except BrokenPipeError:
+            raise IOError(f"上传到 MinIO 失败: {self._error}")
+
+    def _close_writer(self):
+        if self._write_fd is not None:
+            os.close(self._write_fd)
+            self._write_fd = None
+
+    def _finish(self):
+        self._close_writer()
+        # 大部分数据已在解析请求时上传，这里只等待最后一个分片
+        with timed('minio_upload'):
+            self._thread.join()
+        if self._error:
+            raise IOError(f"上传到 MinIO 失败: {self._error}")
+        return f"{MINIO_PUBLIC_ENDPOINT.rstrip('/')}/{self.bucket_name}/{self.object_name}"
+
+    def _discard(self):
+        if self._thread is None:
+            return
+        self._reader.aborted = True
+        self._close_writer()
+        self._thread.join()
+
+
+def _background_upload_sink(filename, content_type):
+    if ICON_STORAGE_STRATEGY == 'minio':
+        if not minio_client:
+            raise InternalServerError("MinIO 未配置")
+        object_prefix = f"backgrounds/{uuid.uuid4()}-{_upload_stem(filename)}"
+        return MinioUploadSink(filename, MAX_BACKGROUND_UPLOAD_BYTES,
+                               MINIO_BACKGROUND_BUCKET_NAME, object_prefix)
+    return LocalUploadSink(filename, MAX_BACKGROUND_UPLOAD_BYTES,
+                           LOCAL_BACKGROUND_PATH, '/backgrounds')
+
+
+def _icon_upload_sink(filename, content_type):
+    return MemoryUploadSink(filename, MAX_ICON_UPLOAD_BYTES)
+
+
+UPLOAD_SINK_FACTORIES = {
+    'upload_background': _background_upload_sink,
+    'prepare_item_api': _icon_upload_sink,
+}
+
+
+class StreamingUploadRequest(Request):
+
+    def _get_file_stream(self,
+                         total_content_length,
+                         content_type,
+                         filename=None,
+                         content_length=None):
+        factory = UPLOAD_SINK_FACTORIES.get(self.endpoint)
+        if factory is None or not filename:
+            return super()._get_file_stream(total_content_length,
+                                            content_type, filename,
+                                            content_length)
+        content_type = (content_type or '').split(';')[0].strip().lower()
+        if content_type and not content_type.startswith(
+                'image/') and content_type != 'application/octet-stream':
+            raise UnsupportedMediaType(f"不支持的文件类型: {content_type}")
+        sink = factory(filename, content_type)
+        self.upload_sinks.append(sink)
+        return sink
+
+    @cached_property
+    def upload_sinks(self):
+        return []
+
+
+app.request_class = StreamingUploadRequest
+
+
+@app.teardown_request
+def _discard_unfinished_uploads(exc):
+    for sink in request.upload_sinks:
+        sink.abort()
+
+
+@app.errorhandler(EmptyUpload)
+@app.errorhandler(RequestEntityTooLarge)
+@app.errorhandler(UnsupportedMediaType)
+def _upload_rejected(e):
+    return jsonify({"error": f"上传被拒绝: {e.description}"}), e.code
+
+
+@app.route('/')
+def index():
+    return render_template('index.html')
+
+
+@app.route('/api/settings', methods=['GET'])
+def get_settings():
+    return _load_document(HOMEPAGE_SETTINGS_PATH, 'settings.yaml', {})
+
+
+@app.route('/api/settings/background', methods=['POST'])
+def save_background_settings():
+    new_bg_data = request.get_json()
+    try:
+        with config_write_lock(HOMEPAGE_SETTINGS_PATH):
+            # 缓存中的文档是共享的，复制一份再修改
+            all_settings = dict(
+                _load_document_for_update(HOMEPAGE_SETTINGS_PATH)[0] or {})
+            all_settings['background'] = new_bg_data
+            dump_yaml(HOMEPAGE_SETTINGS_PATH,
+                      all_settings,
+                      reason='background')
+        return jsonify({"message": "背景设置已成功保存！"})
+    except Exception as e:
+        return jsonify({"error": f"写入 settings.yaml 失败: {e}"}), 500
+
+
+# 历史版本: 每次写入配置文档时在 HISTORY_PATH/<文档名>/ 下追加一条记录 (log.jsonl)。
+# 内容按修订号去重保存在 objects/ 中: 大多数版本只保存相对上一版本的行级差异
+# (difflib 操作码，zlib 压缩)，每 HISTORY_SNAPSHOT_INTERVAL 个差异保存一次完整快照，
+# 以限制还原时需要回放的差异数量。超过 HISTORY_MAX_REVISIONS 的旧记录及其不再需要的
+# 对象会被清理。所有操作都在 config_write_lock 内进行。
+HISTORY_PATH = os.getenv('HISTORY_PATH', os.path.join(DATA_DIR, 'history'))
+HISTORY_MAX_REVISIONS = int(os.getenv('HISTORY_MAX_REVISIONS', '200'))
+HISTORY_SNAPSHOT_INTERVAL = int(os.getenv('HISTORY_SNAPSHOT_INTERVAL', '20'))
+HISTORY_DOCUMENTS = {
+    'services': HOMEPAGE_CONFIG_PATH,
+    'bookmarks': HOMEPAGE_BOOKMARKS_PATH,
+    'settings': HOMEPAGE_SETTINGS_PATH,
+}
+
+
+def _history_dir(path):
+    return os.path.join(HISTORY_PATH,
+                        os.path.splitext(os.path.basename(path))[0])
+
+
+def _history_objects(directory):
+    """返回 {修订号: 差异的基准修订号 (完整快照为 None)}，对象文件名本身记录了依赖关系。"""
+    objects = {}
+    try:
+        names = os.listdir(os.path.join(directory, 'objects'))
+    except FileNotFoundError:
+        return objects
+    for name in names:
+        if name.endswith('.full.z'):
+            objects[name[:-len('.full.z')]] = None
+        elif name.endswith('.delta.z'):
+            revision, _, base = name[:-len('.delta.z')].partition('~')
+            objects[revision] = base
+    return objects
+
+
+def _object_path(directory, revision, base):
+    name = f"{revision}~{base}.delta.z" if base else f"{revision}.full.z"
+    return os.path.join(directory, 'objects', name)
+
+
+def _history_entries(directory):
+    try:
+        with open(os.path.join(directory, 'log.jsonl'),
+                  encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def _chain_length(objects, revision):
+    length = 0
+    while objects.get(revision):
+        revision = objects[revision]
+        length += 1
+    return length
+
+
+def _compute_delta(old_raw, new_raw):
+    old_lines = old_raw.decode('utf-8').splitlines(keepends=True)
+    new_lines = new_raw.decode('utf-8').splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines,
+                                      autojunk=False)
+    return [[i1, i2, new_lines[j1:j2]]
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+            if tag != 'equal']
+
+
+def _apply_delta(base_raw, ops):
+    lines = base_raw.decode('utf-8').splitlines(keepends=True)
+    result, position = [], 0
+    for start, end, replacement in ops:
+        result.extend(lines[position:start])
+        result.extend(replacement)
+        position = end
+    result.extend(lines[position:])
+    return ''.join(result).encode('utf-8')
+
+
+def _read_history_object(directory, objects, revision):
+    """还原某个修订号的完整内容: 找到最近的完整快照，再依次回放差异。"""
+    chain = []
+    while True:
+        if revision not in objects:
+            raise KeyError(revision)
+        chain.append(revision)
+        if objects[revision] is None:
+            break
+        revision = objects[revision]
+    with open(_object_path(directory, chain[-1], None), 'rb') as f:
+        raw = zlib.decompress(f.read())
+    for revision in reversed(chain[:-1]):
+        with open(_object_path(directory, revision, objects[revision]),
+                  'rb') as f:
+            raw = _apply_delta(raw, json.loads(zlib.decompress(f.read())))
+    return raw
+
+
+def _write_history_file(path, content):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(content)
+    os.replace(temp_path, path)
+
+
+def _store_history_object(directory, objects, revision, raw, base, base_raw):
+    if revision in objects:
+        return
+    if base is None or _chain_length(objects,
+                                     base) + 1 >= HISTORY_SNAPSHOT_INTERVAL:
+        base, content = None, raw
+    else:
+        content = json.dumps(_compute_delta(base_raw, raw),
+                             ensure_ascii=False).encode('utf-8')
+    os.makedirs(os.path.join(directory, 'objects'), exist_ok=True)
+    _write_history_file(_object_path(directory, revision, base),
+                        zlib.compress(content, 9))
+    objects[revision] = base
+
+
+def _prune_history(directory, entries, objects):
+    """只保留最近 HISTORY_MAX_REVISIONS 条记录，删除它们不再依赖的对象。"""
+    kept = entries[-HISTORY_MAX_REVISIONS:]
+    _write_history_file(
+        os.path.join(directory, 'log.jsonl'),
+        ''.join(json.dumps(entry, ensure_ascii=False) + '\n'
+                for entry in kept).encode('utf-8'))
+    needed = set()
+    for entry in kept:
+        revision = entry['revision']
+        while revision and revision not in needed:
+            needed.add(revision)
+            revision = objects.get(revision)
+    for revision, base in list(objects.items()):
+        if revision not in needed:
+            os.remove(_object_path(directory, revision, base))
+            del objects[revision]
+
+
+def record_history(path, previous_raw, raw, reason):
+    """在历史中追加新内容；旧内容不在历史中时 (如外部修改) 先把它记录下来。"""
+    directory = _history_dir(path)
+    entries = _history_entries(directory)
+    objects = _history_objects(directory)
+    head = entries[-1]['revision'] if entries else None
+    new_entries = []
+    base, base_raw = None, None
+    if previous_raw is not None:
+        previous_revision = _content_revision(previous_raw)
+        if previous_revision != head:
+            _store_history_object(directory, objects, previous_revision,
+                                  previous_raw, None, None)
+            new_entries.append({
+                'revision': previous_revision,
+                'time': time.time(),
+                'size': len(previous_raw),
+                'reason': 'external'
+            })
+        base, base_raw = previous_revision, previous_raw
+    revision = _content_revision(raw)
+    if revision != (new_entries[-1]['revision'] if new_entries else head):
+        _store_history_object(directory, objects, revision, raw, base,
+                              base_raw)
+        new_entries.append({
+            'revision': revision,
+            'time': time.time(),
+            'size': len(raw),
+            'reason': reason
+        })
+    if not new_entries:
+        return
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, 'log.jsonl'), 'a',
+              encoding='utf-8') as f:
+        for entry in new_entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    entries += new_entries
+    if len(entries) > HISTORY_MAX_REVISIONS:
+        _prune_history(directory, entries, objects)
+
+
+def read_history_revision(path, revision):
+    """读取某个历史版本的原始内容，不存在时抛出 KeyError。"""
+    directory = _history_dir(path)
+    return _read_history_object(directory, _history_objects(directory),
+                                revision)
+
+
+def _history_document(name):
+    path = HISTORY_DOCUMENTS.get(name)
+    if not path:
+        abort(404)
+    return path
+
+
+@app.route('/api/history/<name>', methods=['GET'])
+def list_history(name):
+    path = _history_document(name)
+    try:
+        _, current = load_yaml_revision(path)
+    except FileNotFoundError:
+        current = EMPTY_REVISION
+    entries = _history_entries(_history_dir(path))
+    return jsonify([{
+        **entry, 'current': entry['revision'] == current
+    } for entry in reversed(entries)])
+
+
+@app.route('/api/history/<name>/<revision>', methods=['GET'])
+def get_history_revision(name, revision):
+    path = _history_document(name)
+    try:
+        raw = read_history_revision(path, revision)
+    except KeyError:
+        return jsonify({"error": f"找不到修订版本 {revision}"}), 404
+    response = Response(raw, mimetype='application/yaml')
+    response.set_etag(revision)
+    return response
+
+
+@app.route('/api/history/<name>/diff', methods=['GET'])
+def diff_history(name):
+    """比较两个修订版本 (to 默认为当前版本)，返回统一格式的差异文本。"""
+    path = _history_document(name)
+    old_revision = request.args.get('from')
+    new_revision = request.args.get('to')
+    if not old_revision:
+        return jsonify({"error": "缺少 from 修订号"}), 400
+    try:
+        old_raw = read_history_revision(path, old_revision)
+        if new_revision:
+            new_raw = read_history_revision(path, new_revision)
+        else:
+            with open(path, 'rb') as f:
+                new_raw = f.read()
+            new_revision = _content_revision(new_raw)
+    except KeyError as e:
+        return jsonify({"error": f"找不到修订版本 {e.args[0]}"}), 404
+    except FileNotFoundError:
+        new_raw, new_revision = b'', EMPTY_REVISION
+    diff = difflib.unified_diff(
+        old_raw.decode('utf-8').splitlines(keepends=True),
+        new_raw.decode('utf-8').splitlines(keepends=True),
+        fromfile=f"{name}@{old_revision}",
+        tofile=f"{name}@{new_revision}")
+    return jsonify({
+        "from": old_revision,
+        "to": new_revision,
+        "diff": ''.join(diff)
+    })
+
+
+@app.route('/api/history/<name>/rollback', methods=['POST'])
+def rollback_history(name):
+    """原子地把文档恢复为某个历史版本，回滚本身也会记录为一个新的历史条目。"""
+    path = _history_document(name)
+    body = request.get_json(silent=True)
+    revision = body.get('revision') if isinstance(body, dict) else None
+    if not revision:
+        return jsonify({"error": "缺少要回滚到的修订号"}), 400
+    try:
+        with config_write_lock(path):
+            _, current = _load_document_for_update(path)
+            if request.if_match and not etags_match_revision(
+                    request.if_match, current):
+                return jsonify({
+                    "error": f"{os.path.basename(path)} 已被其他编辑者修改，请刷新后重试",
+                    "revision": current
+                }), 412
+            raw = read_history_revision(path, revision)
+            data = yaml.load(raw.decode('utf-8'), Loader=YamlLoader)
+            new_revision = write_document(path, raw, data, 'rollback')
+        return _document_response(
+            {
+                "message": f"已回滚到版本 {revision}",
+                "revision": new_revision
+            }, new_revision)
+    except KeyError:
+        return jsonify({"error": f"找不到修订版本 {revision}"}), 404
+    except Exception as e:
+        return jsonify({"error": f"回滚 {os.path.basename(path)} 失败: {e}"}), 500
+
+
+# 背景目录: 在内存中维护背景图片列表。本地模式通过目录 mtime 判断是否需要重新扫描，
+# MinIO 模式由后台线程定期刷新；列表接口支持游标分页、排序、名称过滤和 ETag。
+BACKGROUND_REFRESH_INTERVAL = int(
+    os.getenv('BACKGROUND_REFRESH_INTERVAL', '60'))
+BACKGROUND_PAGE_SIZE = 60
+BACKGROUND_MAX_PAGE_SIZE = 500
+
+_background_catalog = {
+    'entries': [],
+    'version': None,
+    'source_key': None,
+    'generation': None,
+    'sorted': {}
+}
+_background_catalog_lock = threading.Lock()
+_background_refresher_started = False
+
+
+def _scan_local_backgrounds():
+    entries = []
+    if not os.path.exists(LOCAL_BACKGROUND_PATH):
+        return entries
+    with os.scandir(LOCAL_BACKGROUND_PATH) as it:
+        for entry in it:
+            if entry.name.startswith('.') or not entry.is_file():
+                continue
+            st = entry.stat()
+            entries.append({
+                "url":
+                f"/backgrounds/{entry.name}",
+                "thumb":
+                thumbnail_url('backgrounds', entry.name,
+                              BACKGROUND_THUMBNAIL_SIZE),
+                "name":
+                entry.name,
+                "modified": st.st_mtime,
+                "size": st.st_size
+            })
+    return entries
+
+
+def _scan_minio_backgrounds():
+    if not minio_client.bucket_exists(MINIO_BACKGROUND_BUCKET_NAME):
+        print(f"MinIO 存储桶 '{MINIO_BACKGROUND_BUCKET_NAME}' 不存在。")
+        return []
+    public_base = f"{MINIO_PUBLIC_ENDPOINT.rstrip('/')}/{MINIO_BACKGROUND_BUCKET_NAME}"
+    return [{
+        "url":
+        f"{public_base}/{obj.object_name}",
+        "thumb":
+        thumbnail_url('backgrounds', obj.object_name,
+                      BACKGROUND_THUMBNAIL_SIZE),
+        "name":
+        obj.object_name,
+        "modified":
+        obj.last_modified.timestamp() if obj.last_modified else 0,
+        "size":
+        obj.size
+    } for obj in minio_client.list_objects(MINIO_BACKGROUND_BUCKET_NAME,
+                                           recursive=True) if not obj.is_dir]
+
+
+def _set_background_entries(entries, source_key, generation=None):
+    digest = hashlib.sha1()
+    for entry in sorted(entries, key=lambda e: e['name']):
+        digest.update(
+            f"{entry['name']}\0{entry['modified']}\0{entry['size']}\n".encode(
+                'utf-8'))
+    with _background_catalog_lock:
+        _background_catalog.update(entries=entries,
+                                   version=digest.hexdigest()[:16],
+                                   source_key=source_key,
+                                   generation=generation,
+                                   sorted={})
+
+
+def _minio_background_refresher():
+    while True:
+        time.sleep(BACKGROUND_REFRESH_INTERVAL)
+        try:
+            generation = shared_generation('backgrounds')
+            _set_background_entries(_scan_minio_backgrounds(), time.time(),
+                                    generation)
+        except Exception as e:
+            print(f"后台刷新 MinIO 背景列表失败: {e}")
+
+
+def invalidate_background_catalog():
+    with _background_catalog_lock:
+        _background_catalog['source_key'] = None
+    bump_shared_generation('backgrounds')
+
+
+def get_background_catalog():
+    """返回 (背景条目列表, 版本号)，必要时重新扫描存储。"""
+    global _background_refresher_started
+    if ICON_STORAGE_STRATEGY == 'local':
+        try:
+            source_key = os.stat(LOCAL_BACKGROUND_PATH).st_mtime_ns
+        except FileNotFoundError:
+            source_key = 0
+        if _background_catalog['source_key'] != source_key:
+            _set_background_entries(_scan_local_backgrounds(), source_key)
+    elif ICON_STORAGE_STRATEGY == 'minio':
+        # 其他 worker 上传后会递增共享代数
+        generation = shared_generation('backgrounds')
+        if (_background_catalog['source_key'] is None
+                or _background_catalog['generation'] != generation):
+            _set_background_entries(_scan_minio_backgrounds(), time.time(),
+                                    generation)
+        with _background_catalog_lock:
+            if not _background_refresher_started and BACKGROUND_REFRESH_INTERVAL > 0:
+                _background_refresher_started = True
+                threading.Thread(target=_minio_background_refresher,
+                                 name='background-catalog',
+                                 daemon=True).start()
+    return _background_catalog['entries'], _background_catalog['version']
+
+
+def _background_sort_key(sort):
+    if sort == 'name':
+        return lambda e: (e['name'].lower(), e['name'])
+    return lambda e: (-e['modified'], e['name'])
+
+
+def _sorted_backgrounds(entries, version, sort):
+    cached = _background_catalog['sorted'].get(sort)
+    if cached and cached[0] == version:
+        return cached[1]
+    ordered = sorted(entries, key=_background_sort_key(sort))
+    _background_catalog['sorted'][sort] = (version, ordered)
+    return ordered
+
+
+def _encode_cursor(key):
+    return base64.urlsafe_b64encode(
+        json.dumps(key, ensure_ascii=False).encode('utf-8')).decode('ascii')
+
+
+def _decode_cursor(cursor):
+    try:
+        return tuple(
+            json.loads(base64.urlsafe_b64decode(cursor.encode('ascii'))))
+    except Exception:
+        raise ValueError("无效的分页游标")
+
+
+@app.route('/api/backgrounds', methods=['GET'])
+def list_backgrounds():
+    if ICON_STORAGE_STRATEGY == 'minio' and not minio_client:
+        return jsonify({"error": "MinIO 未配置"}), 500
+    sort = request.args.get('sort', 'modified')
+    if sort not in ('modified', 'name'):
+        return jsonify({"error": f"不支持的排序方式: {sort}"}), 400
+    query = request.args.get('q', '').strip().lower()
+    cursor = request.args.get('cursor')
+    limit = min(
+        max(request.args.get('limit', BACKGROUND_PAGE_SIZE, type=int), 1),
+        BACKGROUND_MAX_PAGE_SIZE)
+    try:
+        entries, version = get_background_catalog()
+    except Exception as e:
+        source = "MinIO" if ICON_STORAGE_STRATEGY == 'minio' else "本地"
+        return jsonify({"error": f"从{source}列出背景失败: {e}"}), 500
+    etag = hashlib.sha1(
+        f"{version}|{sort}|{query}|{cursor}|{limit}".encode('utf-8')).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    ordered = _sorted_backgrounds(entries, version, sort)
+    if query:
+        ordered = [e for e in ordered if query in e['name'].lower()]
+    sort_key = _background_sort_key(sort)
+    start = 0
+    if cursor:
+        try:
+            start = bisect.bisect_right([sort_key(e) for e in ordered],
+                                        _decode_cursor(cursor))
+        except (ValueError, TypeError):
+            return jsonify({"error": "无效的分页游标"}), 400
+    page = ordered[start:start + limit]
+    next_cursor = None
+    if start + limit < len(ordered):
+        next_cursor = _encode_cursor(list(sort_key(page[-1])))
+    response = jsonify({
+        "items": page,
+        "next_cursor": next_cursor,
+        "total": len(ordered)
+    })
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+# 缩略图: 为背景和图标生成小尺寸 WebP 预览，缓存在本地目录中并按 LRU 淘汰，
+# 通过 /thumbs/<类型>/<尺寸>/<名称> 提供服务。上传时预先生成，已有文件按需生成。
+THUMBNAIL_CACHE_PATH = os.getenv('THUMBNAIL_CACHE_PATH',
+                                 os.path.join(DATA_DIR, 'thumbs'))
+THUMBNAIL_CACHE_MAX_BYTES = int(
+    os.getenv('THUMBNAIL_CACHE_MAX_MB', '256')) * 1024 * 1024
+THUMBNAIL_SIZES = {'backgrounds': (320, 640), 'icons': (32, 64, 128)}
+BACKGROUND_THUMBNAIL_SIZE = 320
+ICON_THUMBNAIL_SIZE = 64
+
+thumbnail_executor = ThreadPoolExecutor(max_workers=2,
+                                        thread_name_prefix='thumbnail')
+_thumbnail_cache_bytes = None
+_thumbnail_cache_lock = threading.Lock()
+
+
+def thumbnail_url(kind, name, size):
+    return f"/thumbs/{kind}/{size}/{quote(name)}"
+
+
+def _thumbnail_path(kind, name, size):
+    digest = hashlib.sha1(f"{kind}/{name}".encode('utf-8')).hexdigest()
+    return os.path.join(THUMBNAIL_CACHE_PATH, kind, f"{digest}-{size}.webp")
+
+
+def _local_source_path(kind, name):
+    directory = LOCAL_BACKGROUND_PATH if kind == 'backgrounds' else LOCAL_ICON_PATH
+    path = os.path.realpath(os.path.join(directory, name))
+    if not path.startswith(os.path.realpath(directory) + os.sep):
+        raise FileNotFoundError(name)
+    return path
+
+
+def _read_thumbnail_source(kind, name):
+    """读取原图内容，返回 (内容, 原图修改时间)；MinIO 中的对象视为不可变。"""
+    if ICON_STORAGE_STRATEGY == 'minio':
+        if not minio_client:
+            raise FileNotFoundError(name)
+        bucket = MINIO_BACKGROUND_BUCKET_NAME if kind == 'backgrounds' else MINIO_ICONS_BUCKET_NAME
+        response = minio_client.get_object(bucket, name)
+        try:
+            return response.read(), 0
+        finally:
+            response.close()
+            response.release_conn()
+    path = _local_source_path(kind, name)
+    with open(path, 'rb') as f:
+        return f.read(), os.path.getmtime(path)
+
+
+def _evict_thumbnails():
+    """淘汰最久未使用的缩略图，直到缓存大小降到上限的 80% 以下。"""
+    global _thumbnail_cache_bytes
+    files = []
+    for root, _, names in os.walk(THUMBNAIL_CACHE_PATH):
+        for filename in names:
+            path = os.path.join(root, filename)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+    total = sum(size for _, size, _ in files)
+    if total > THUMBNAIL_CACHE_MAX_BYTES:
+        for _, size, path in sorted(files):
+            if total <= THUMBNAIL_CACHE_MAX_BYTES * 0.8:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+    _thumbnail_cache_bytes = total
+
+
+def _account_thumbnail(size_bytes):
+    global _thumbnail_cache_bytes
+    with _thumbnail_cache_lock:
+        if _thumbnail_cache_bytes is None:
+            _evict_thumbnails()
+        _thumbnail_cache_bytes += size_bytes
+        if _thumbnail_cache_bytes > THUMBNAIL_CACHE_MAX_BYTES:
+            _evict_thumbnails()
+
+
+def _render_thumbnail(content, size):
+    with Image.open(io.BytesIO(content)) as im:
+        im.draft('RGB', (size, size))
+        im = ImageOps.exif_transpose(im)
+        im.thumbnail((size, size), Image.LANCZOS)
+        if im.mode not in ('RGB', 'RGBA'):
+            im = im.convert('RGBA' if 'A' in im.getbands()
+                            or 'transparency' in im.info else 'RGB')
+        buffer = io.BytesIO()
+        im.save(buffer, 'WEBP', quality=80, method=4)
+    return buffer
+
+
+def ensure_thumbnail(kind, name, size):
+    """返回缩略图路径，缓存缺失或原图更新时重新生成；无法生成时返回 None。"""
+    thumb_path = _thumbnail_path(kind, name, size)
+    if ICON_STORAGE_STRATEGY == 'minio' and os.path.exists(thumb_path):
+        os.utime(thumb_path)
+        return thumb_path
+    if ICON_STORAGE_STRATEGY != 'minio':
+        source_mtime = os.path.getmtime(_local_source_path(kind, name))
+        try:
+            if os.path.getmtime(thumb_path) >= source_mtime:
+                os.utime(thumb_path)
+                return thumb_path
+        except FileNotFoundError:
+            pass
+    if os.path.splitext(name)[1].lower() == '.svg':
+        return None
+    content, _ = _read_thumbnail_source(kind, name)
+    try:
+        with timed('thumbnail_render'):
+            buffer = run_blocking(_render_thumbnail, content, size)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        print(f"生成缩略图失败 ({kind}/{name}): {e}")
+        return None
+    os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(thumb_path),
+                                     prefix='.thumb-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(buffer.getvalue())
+        os.replace(temp_path, thumb_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    _account_thumbnail(buffer.tell())
+    return thumb_path
+
+
+def stored_object_name(kind, url):
+    """把配置中的图片地址还原为存储中的文件名/对象名，非本系统存储的地址返回 None。"""
+    if not url:
+        return None
+    if ICON_STORAGE_STRATEGY == 'minio':
+        bucket = MINIO_BACKGROUND_BUCKET_NAME if kind == 'backgrounds' else MINIO_ICONS_BUCKET_NAME
+        prefix = f"{(MINIO_PUBLIC_ENDPOINT or '').rstrip('/')}/{bucket}/"
+    else:
+        prefix = f"/{kind}/"
+    return url[len(prefix):] if url.startswith(prefix) else None
+
+
+def schedule_thumbnails(kind, url):
+    name = stored_object_name(kind, url)
+    if not name:
+        return
+
+    def generate():
+        for size in THUMBNAIL_SIZES[kind]:
+            try:
+                ensure_thumbnail(kind, name, size)
+            except Exception as e:
+                print(f"预生成缩略图失败 ({kind}/{name}): {e}")
+
+    thumbnail_executor.submit(generate)
+
+
+@app.route('/thumbs/<kind>/<int:size>/<path:name>')
+def serve_thumbnail(kind, size, name):
+    if size not in THUMBNAIL_SIZES.get(kind, ()):
+        return jsonify({"error": "不支持的缩略图类型或尺寸"}), 404
+    try:
+        thumb_path = ensure_thumbnail(kind, name, size)
+    except FileNotFoundError:
+        return jsonify({"error": "原图不存在"}), 404
+    except Exception as e:
+        return jsonify({"error": f"生成缩略图失败: {e}"}), 500
+    if not thumb_path:
+        # 无法生成缩略图 (如 SVG) 时回退到原图
+        if ICON_STORAGE_STRATEGY == 'minio':
+            bucket = MINIO_BACKGROUND_BUCKET_NAME if kind == 'backgrounds' else MINIO_ICONS_BUCKET_NAME
+            return redirect(
+                f"{MINIO_PUBLIC_ENDPOINT.rstrip('/')}/{bucket}/{name}")
+        return redirect(f"/{kind}/{quote(name)}")
+    return send_file(thumb_path, mimetype='image/webp', max_age=86400)
+
+
+@app.route('/api/backgrounds/upload', methods=['POST'])
+def upload_background():
+    if 'file' not in request.files: return jsonify({"error": "请求中没有文件部分"}), 400
+    file = request.files['file']
+    if file.filename == '': return jsonify({"error": "没有选择文件"}), 400
+    try:
+        final_url = file.stream.commit()
+        invalidate_background_catalog()
+        schedule_thumbnails('backgrounds', final_url)
+        name = stored_object_name('backgrounds', final_url)
+        return jsonify({
+            "message":
+            "背景上传成功",
+            "url":
+            final_url,
+            "sha256":
+            file.stream.digest,
+            "thumb":
+            thumbnail_url('backgrounds', name, BACKGROUND_THUMBNAIL_SIZE)
+            if name else final_url
+        })
+    except UPLOAD_REJECTIONS:
+        raise
+    except Exception as e:
+        return jsonify({"error": f"处理上传文件时出错: {e}"}), 500
+
+
+# Docker 容器发现: DOCKER_API_ENDPOINT 可以是逗号分隔的多个主机 (含 unix:// 套接字)，
+# 每个主机使用独立的连接池并发查询，结果按主机缓存；过期后先返回旧结果再在后台刷新，
+# 可选订阅 Docker /events 事件流，在容器变化时立即刷新缓存。
+DOCKER_CACHE_TTL = int(os.getenv('DOCKER_CACHE_TTL', '15'))
+DOCKER_WATCH_EVENTS = os.getenv('DOCKER_WATCH_EVENTS',
+                                'false').lower() in ('1', 'true', 'yes')
+DOCKER_UNIX_SOCKET_HOST = os.getenv('DOCKER_UNIX_SOCKET_HOST', 'localhost')
+DOCKER_REQUEST_TIMEOUT = 10
+
+
+class _UnixSocketConnection(HTTPConnection):
+
+    def __init__(self, socket_path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if isinstance(self.timeout, (int, float)):
+            sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class _UnixSocketConnectionPool(HTTPConnectionPool):
+
+    def __init__(self, socket_path, maxsize):
+        super().__init__('localhost', maxsize=maxsize)
+        self.socket_path = socket_path
+
+    def _new_conn(self):
+        return _UnixSocketConnection(self.socket_path,
+                                     timeout=self.timeout.connect_timeout)
+
+
+class UnixSocketAdapter(HTTPAdapter):
+    """让 requests 通过 unix 套接字访问 Docker API 的传输适配器。"""
+
+    def __init__(self, socket_path, maxsize=4):
+        super().__init__()
+        self._pool = _UnixSocketConnectionPool(socket_path, maxsize)
+
+    def get_connection_with_tls_context(self,
+                                        request,
+                                        verify,
+                                        proxies=None,
+                                        cert=None):
+        return self._pool
+
+    def get_connection(self, url, proxies=None):
+        return self._pool
+
+    def close(self):
+        self._pool.close()
+
+
+def _parse_docker_endpoints(value):
+    """解析 "地址[|公开主机名]" 逗号分隔列表，公开主机名用于生成建议的访问地址。"""
+    hosts = []
+    for entry in (e.strip() for e in (value or '').split(',')):
+        if not entry:
+            continue
+        endpoint, _, public_host = entry.partition('|')
+        endpoint = endpoint.strip()
+        if endpoint.startswith('unix://'):
+            session = InstrumentedSession('docker')
+            session.mount('http://docker/',
+                          UnixSocketAdapter(endpoint[len('unix://'):]))
+            base_url = 'http://docker'
+            public_host = public_host.strip() or DOCKER_UNIX_SOCKET_HOST
+        else:
+            session = InstrumentedSession('docker')
+            session.mount(endpoint, HTTPAdapter(pool_maxsize=4))
+            base_url = endpoint.rstrip('/')
+            public_host = public_host.strip() or urlparse(endpoint).hostname
+        hosts.append({
+            'endpoint': endpoint,
+            'base_url': base_url,
+            'public_host': public_host,
+            'session': session
+        })
+    return hosts
+
+
+DOCKER_HOSTS = _parse_docker_endpoints(DOCKER_API_ENDPOINT)
+# 请求内的并发查询与后台刷新使用各自的线程池，慢速的后台刷新不会阻塞下一次请求
+docker_executor = ThreadPoolExecutor(max_workers=max(len(DOCKER_HOSTS), 1),
+                                     thread_name_prefix='docker')
+docker_refresh_executor = ThreadPoolExecutor(
+    max_workers=max(len(DOCKER_HOSTS), 1),
+    thread_name_prefix='docker-refresh')
+_docker_cache = {}
+_docker_failures = {}
+_docker_refreshing = set()
+_docker_watching = set()
+_docker_cache_lock = threading.Lock()
+
+
+def _simplify_containers(containers_data, docker_host):
+    simplified_containers = []
+    for c in containers_data:
+        name = c.get('Names', ['/无名称'])[0].lstrip('/')
+        ports_info = c.get('Ports', [])
+        suggested_urls = []
+        processed_public_ports = set()
+        sorted_ports = sorted(
+            ports_info,
+            key=lambda p:
+            (p.get('PrivatePort') not in [80, 443, 8080, 8000, 3000],
+             p.get('PrivatePort') or 0))
+        for p in sorted_ports:
+            public_port = p.get('PublicPort')
+            if public_port and p.get(
+                    'Type') == 'tcp' and public_port not in processed_public_ports:
+                suggested_urls.append(f"http://{docker_host}:{public_port}")
+                processed_public_ports.add(public_port)
+        simplified_containers.append({
+            'Id': c.get('Id')[:12],
+            'Name': name,
+            'Image': c.get('Image'),
+            'State': c.get('State'),
+            'Host': docker_host,
+            'suggested_urls': suggested_urls
+        })
+    return simplified_containers
+
+
+def _refresh_docker_host(host):
+    try:
+        response = host['session'].get(
+            f"{host['base_url']}/containers/json?all=true",
+            timeout=DOCKER_REQUEST_TIMEOUT)
+        response.raise_for_status()
+        containers = _simplify_containers(response.json(),
+                                          host['public_host'])
+        with _docker_cache_lock:
+            _docker_cache[host['endpoint']] = (time.monotonic(), containers)
+            _docker_failures.pop(host['endpoint'], None)
+        return containers
+    except Exception as e:
+        with _docker_cache_lock:
+            _docker_failures[host['endpoint']] = (time.monotonic(), e)
+        raise
+    finally:
+        with _docker_cache_lock:
+            _docker_refreshing.discard(host['endpoint'])
+
+
+def _refresh_docker_host_in_background(host):
+    with _docker_cache_lock:
+        if host['endpoint'] in _docker_refreshing:
+            return
+        _docker_refreshing.add(host['endpoint'])
+
+    def refresh():
+        try:
+            _refresh_docker_host(host)
+        except Exception as e:
+            print(f"后台刷新 Docker 主机 {host['endpoint']} 失败: {e}")
+
+    docker_refresh_executor.submit(refresh)
+
+
+def _watch_docker_events(host):
+    """订阅容器事件，收到事件即在后台刷新该主机的缓存 (刷新完成前继续使用旧数据)；断开后自动重连。"""
+    backoff = 1
+    while True:
+        try:
+            with host['session'].get(
+                    f"{host['base_url']}/events",
+                    params={'filters': json.dumps({'type': ['container']})},
+                    stream=True,
+                    timeout=(DOCKER_REQUEST_TIMEOUT, None)) as response:
+                response.raise_for_status()
+                backoff = 1
+                for line in response.iter_lines():
+                    if line:
+                        _refresh_docker_host_in_background(host)
+        except Exception as e:
+            print(f"Docker 主机 {host['endpoint']} 的事件流中断: {e}")
+        time.sleep(backoff)
+        backoff = min(backoff * 2, 60)
+
+
+def _ensure_docker_watchers():
+    if not DOCKER_WATCH_EVENTS:
+        return
+    with _docker_cache_lock:
+        for host in DOCKER_HOSTS:
+            if host['endpoint'] not in _docker_watching:
+                _docker_watching.add(host['endpoint'])
+                threading.Thread(target=_watch_docker_events,
+                                 args=(host, ),
+                                 name='docker-events',
+                                 daemon=True).start()
+
+
+def _cached_docker_host_containers(host):
+    """不访问网络地返回主机的容器列表: 缓存有效时直接返回，过期时返回旧数据并在后台刷新；
+    没有缓存时返回 None。"""
+    cached = _docker_cache.get(host['endpoint'])
+    if cached:
+        if time.monotonic() - cached[0] > DOCKER_CACHE_TTL:
+            _refresh_docker_host_in_background(host)
+        return cached[1]
+    failure = _docker_failures.get(host['endpoint'])
+    if failure and time.monotonic() - failure[0] <= DOCKER_CACHE_TTL:
+        # 最近连接失败的主机不再同步等待，直接返回上次的错误并在后台重试
+        _refresh_docker_host_in_background(host)
+        raise failure[1]
+    return None
+
+
+@app.route('/api/docker/containers', methods=['GET'])
+def get_docker_containers():
+    if not DOCKER_HOSTS:
+        return jsonify({"error": "Docker API 端点未配置"}), 500
+    _ensure_docker_watchers()
+    if request.args.get('refresh'):
+        with _docker_cache_lock:
+            _docker_cache.clear()
+            _docker_failures.clear()
+    # 命中缓存的主机直接在当前线程返回，只有未缓存的主机才提交到线程池并发查询
+    results = {}
+    for host in DOCKER_HOSTS:
+        try:
+            containers = _cached_docker_host_containers(host)
+        except Exception as e:
+            results[host['endpoint']] = e
+            continue
+        if containers is None:
+            containers = docker_executor.submit(_refresh_docker_host, host)
+        results[host['endpoint']] = containers
+    simplified_containers, errors = [], []
+    for host in DOCKER_HOSTS:
+        result = results[host['endpoint']]
+        try:
+            if isinstance(result, Exception):
+                raise result
+            if isinstance(result, Future):
+                result = result.result()
+            simplified_containers.extend(result)
+        except requests.exceptions.RequestException as e:
+            errors.append(f"连接 Docker API ({host['endpoint']}) 失败: {e}")
+        except Exception as e:
+            errors.append(
+                f"获取 Docker 主机 {host['endpoint']} 的容器列表时发生错误: {e}")
+    for error in errors:
+        print(error)
+    if errors and len(errors) == len(DOCKER_HOSTS):
+        return jsonify({"error": "; ".join(errors)}), 500
+    return jsonify(simplified_containers)
+
+
+# Lucky 规则同步: 缓存展开后的规则并为每条规则计算指纹，与 services.yaml 中已有的
+# 服务 (按 href / 内网地址匹配) 对比后只返回新增或变化的规则。
+LUCKY_CACHE_TTL = int(os.getenv('LUCKY_CACHE_TTL', '30'))
+LUCKY_LOG_PREVIEW_CHARS = 500
+
+lucky_session = InstrumentedSession('lucky')
+lucky_session.headers.update({
+    'openToken': LUCKY_API_TOKEN or '',
+    'User-Agent': 'Homepage-Web-Editor/1.0'
+})
+_lucky_cache = {'fetched_at': 0, 'proxies': None, 'version': None}
+_lucky_cache_lock = threading.Lock()
+
+
+def _lucky_payload_summary(lucky_data):
+    """生成有长度上限的响应摘要，避免把整个响应打印到日志中。"""
+    if isinstance(lucky_data, dict):
+        parts = []
+        for key, value in list(lucky_data.items())[:20]:
+            if isinstance(value, list):
+                parts.append(f"{key}=list[{len(value)}]")
+            elif isinstance(value, dict):
+                parts.append(f"{key}=dict[{len(value)}]")
+            else:
+                parts.append(f"{key}={str(value)[:80]!r}")
+        summary = f"keys({len(lucky_data)}): " + ", ".join(parts)
+    else:
+        summary = f"{type(lucky_data).__name__}: {str(lucky_data)}"
+    return summary[:LUCKY_LOG_PREVIEW_CHARS]
+
+
+def _simplify_lucky_rules(lucky_data):
+    all_rules = []
+    if isinstance(lucky_data, dict) and isinstance(
+            lucky_data.get('ruleList'), list):
+        for rule_group in lucky_data['ruleList']:
+            if isinstance(rule_group, dict) and isinstance(
+                    rule_group.get('ProxyList'), list):
+                all_rules.extend(rule_group['ProxyList'])
+
+    if not all_rules:
+        error_msg = "在Lucky API的响应中未能找到任何'ProxyList'。"
+        print(f"[DEBUG] {error_msg} 响应摘要: {_lucky_payload_summary(lucky_data)}")
+        raise ValueError(error_msg)
+
+    simplified_proxies = []
+    for rule in all_rules:
+        if (isinstance(rule, dict) and rule.get('Enable')
+                and rule.get('Domains') and isinstance(rule.get('Domains'), list)
+                and rule['Domains'] and rule.get('Locations')
+                and isinstance(rule.get('Locations'), list)
+                and rule['Locations']):
+
+            domain = rule['Domains'][0]
+            proxy = {
+                'Name': rule.get('Remark') or domain,
+                'Url': f"https://{domain}",
+                'LanUrl': rule['Locations'][0]
+            }
+            proxy['Fingerprint'] = hashlib.sha1(
+                json.dumps(proxy, sort_keys=True,
+                           ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+            simplified_proxies.append(proxy)
+    return simplified_proxies
+
+
+def fetch_lucky_proxies(force=False):
+    """返回 (规则列表, 版本号)，在 LUCKY_CACHE_TTL 秒内复用缓存。"""
+    with _lucky_cache_lock:
+        if not force and _lucky_cache['proxies'] is not None and (
+                time.monotonic() - _lucky_cache['fetched_at'] <
+                LUCKY_CACHE_TTL):
+            return _lucky_cache['proxies'], _lucky_cache['version']
+        api_url = f"{LUCKY_API_ENDPOINT.rstrip('/')}/api/webservice/rules"
+        response = lucky_session.get(api_url, timeout=10)
+        response.raise_for_status()
+        proxies = _simplify_lucky_rules(response.json())
+        version = hashlib.sha1(''.join(
+            sorted(p['Fingerprint'] for p in proxies)).encode()).hexdigest()
+        if version != _lucky_cache['version']:
+            print(f"Lucky 规则已更新: 共 {len(proxies)} 条启用的代理规则。")
+        _lucky_cache.update(fetched_at=time.monotonic(),
+                            proxies=proxies,
+                            version=version)
+        return proxies, version
+
+
+def _normalize_url(url):
+    return (url or '').strip().rstrip('/').lower()
+
+
+_LAN_URL_PATTERN = re.compile(r'内网地址\s*[:：]\s*(\S+)')
+
+
+def _description_lan_url(description):
+    """从服务描述中解析导入时记录的 "内网地址: <url>"，没有记录时返回 None。"""
+    match = _LAN_URL_PATTERN.search(str(description or ''))
+    return _normalize_url(match.group(1)) if match else None
+
+
+def _compare_lucky_with_services(proxies):
+    """为每条规则标注状态: new (未导入)、changed (已导入但地址有变化)、unchanged。"""
+    services = []
+    try:
+        for group in load_yaml(HOMEPAGE_CONFIG_PATH) or []:
+            for item in next(iter(group.values()), None) or []:
+                for name, details in item.items():
+                    if isinstance(details, dict):
+                        services.append(
+                            (name, _normalize_url(details.get('href')),
+                             _description_lan_url(details.get('description'))))
+    except FileNotFoundError:
+        pass
+    by_href = {href: (name, lan) for name, href, lan in services if href}
+    annotated = []
+    for proxy in proxies:
+        url, lan_url = _normalize_url(proxy['Url']), _normalize_url(
+            proxy['LanUrl'])
+        status, service_name = 'new', None
+        if url in by_href:
+            service_name, recorded_lan = by_href[url]
+            # 描述中记录了其他内网地址时，说明规则的目标地址已变化
+            if lan_url and recorded_lan and recorded_lan != lan_url:
+                status = 'changed'
+            else:
+                status = 'unchanged'
+        elif lan_url:
+            for name, href, recorded_lan in services:
+                if lan_url in (href, recorded_lan):
+                    status, service_name = 'changed', name
+                    break
+        annotated.append({**proxy, 'Status': status, 'Service': service_name})
+    return annotated
+
+
+@app.route('/api/lucky/proxies', methods=['GET'])
+def get_lucky_proxies():
+    """获取 Lucky 反向代理规则列表，默认只返回新增或变化的规则 (?all=1 返回全部)"""
+    if not (LUCKY_API_ENDPOINT and LUCKY_API_TOKEN):
+        return jsonify({"error": "Lucky API 端点或Token未在环境变量中配置"}), 500
+
+    try:
+        proxies, version = fetch_lucky_proxies(
+            force=bool(request.args.get('refresh')))
+        annotated = cached_derived(
+            'lucky', (HOMEPAGE_CONFIG_PATH, ),
+            lambda: _compare_lucky_with_services(proxies),
+            extra_key=version)
+        if not request.args.get('all'):
+            annotated = [p for p in annotated if p['Status'] != 'unchanged']
+        return jsonify(annotated)
+
+    except requests.exceptions.RequestException as e:
+        return jsonify({"error": f"连接 Lucky API 失败: {e}"}), 500
+    except Exception as e:
+        return jsonify({"error": f"处理 Lucky 数据时发生错误: {e}"}), 500
+
+
+# 服务可达性: 并发探测 services.yaml 中每个服务的 href 以及 Lucky 规则的内网地址，
+# 每个主机同时最多 STATUS_PER_HOST_LIMIT 个连接，结果按 STATUS_CACHE_TTL 缓存。
+# /api/status 立即返回缓存的结果 (并在后台刷新过期项)，/api/status/stream 通过 SSE
+# 在探测完成时逐条推送。同步/多线程模式下一个长连接会占用整个 worker，因此页面只在
+# 异步模式 (stream 为 true) 下使用 SSE，否则轮询 /api/status；SSE 连接也最多保持
+# STATUS_STREAM_MAX_SECONDS 秒。
+STATUS_CACHE_TTL = int(os.getenv('STATUS_CACHE_TTL', '60'))
+STATUS_PROBE_TIMEOUT = float(os.getenv('STATUS_PROBE_TIMEOUT', '3'))
+STATUS_PROBE_WORKERS = int(os.getenv('STATUS_PROBE_WORKERS', '32'))
+STATUS_PER_HOST_LIMIT = int(os.getenv('STATUS_PER_HOST_LIMIT', '4'))
+STATUS_STREAM_MAX_SECONDS = float(os.getenv('STATUS_STREAM_MAX_SECONDS', '15'))
+
+status_session = InstrumentedSession('websites')
+status_session.verify = False
+status_session.headers['User-Agent'] = 'Homepage-Web-Editor/1.0'
+_status_adapter = HTTPAdapter(pool_connections=64,
+                              pool_maxsize=STATUS_PER_HOST_LIMIT)
+status_session.mount('http://', _status_adapter)
+status_session.mount('https://', _status_adapter)
+status_executor = ThreadPoolExecutor(max_workers=STATUS_PROBE_WORKERS,
+                                     thread_name_prefix='status-probe')
+_status_cache = {}
+_status_inflight = {}
+_status_host_limits = {}
+_status_lock = threading.Lock()
+
+
+def _host_limit(url):
+    host = urlparse(url).netloc.lower()
+    with _status_lock:
+        limit = _status_host_limits.get(host)
+        if limit is None:
+            limit = _status_host_limits[host] = threading.BoundedSemaphore(
+                STATUS_PER_HOST_LIMIT)
+        return limit
+
+
+def probe_service(url):
+    """探测一个地址: 任意非 5xx 响应 (包括重定向和需要登录) 都视为在线。"""
+    result = {'url': url, 'checked_at': time.time()}
+    start = time.perf_counter()
+    try:
+        with _host_limit(url):
+            response = status_session.head(url,
+                                           timeout=STATUS_PROBE_TIMEOUT,
+                                           allow_redirects=False)
+            if response.status_code in (405, 501):
+                with status_session.get(url,
+                                        timeout=STATUS_PROBE_TIMEOUT,
+                                        allow_redirects=False,
+                                        stream=True) as response:
+                    pass
+        result.update(up=response.status_code < 500,
+                      status=response.status_code)
+    except requests.RequestException as e:
+        result.update(up=False, status=None, error=type(e).__name__)
+    result['latency_ms'] = round((time.perf_counter() - start) * 1000, 1)
+    return result
+
+
+def _store_status(url, future):
+    with _status_lock:
+        _status_inflight.pop(url, None)
+        if not future.cancelled() and future.exception() is None:
+            _status_cache[url] = future.result()
+
+
+def cached_status(url):
+    """返回未过期的探测结果，没有时返回 None。"""
+    result = _status_cache.get(url)
+    if result and time.time() - result['checked_at'] < STATUS_CACHE_TTL:
+        return result
+    return None
+
+
+def schedule_probe(url):
+    """在后台探测地址，同一地址同时只探测一次，返回 Future。"""
+    with _status_lock:
+        future = _status_inflight.get(url)
+        if future is None:
+            future = _status_inflight[url] = status_executor.submit(
+                probe_service, url)
+            future.add_done_callback(lambda f: _store_status(url, f))
+        return future
+
+
+def _service_status_targets():
+    urls = []
+    try:
+        for group in load_yaml(HOMEPAGE_CONFIG_PATH) or []:
+            for item in next(iter(group.values()), None) or []:
+                for details in item.values():
+                    if isinstance(details, dict) and isinstance(
+                            details.get('href'), str):
+                        urls.append(details['href'])
+    except FileNotFoundError:
+        pass
+    return urls
+
+
+def status_targets():
+    """所有需要探测的地址 (去重并保持顺序)，Lucky 规则只使用已缓存的列表，不额外请求。"""
+    urls = list(
+        cached_derived('status_targets', (HOMEPAGE_CONFIG_PATH, ),
+                       _service_status_targets))
+    urls += [p['LanUrl'] for p in _lucky_cache['proxies'] or []]
+    return [
+        url for url in dict.fromkeys(urls)
+        if urlparse(url).scheme in ('http', 'https')
+    ]
+
+
+@app.route('/api/status', methods=['GET'])
+def get_service_status():
+    """立即返回缓存的可达性结果，并在后台刷新过期或缺失的地址。"""
+    items, pending = {}, 0
+    for url in status_targets():
+        result = cached_status(url)
+        if result:
+            items[url] = result
+        else:
+            schedule_probe(url)
+            pending += 1
+    return jsonify({
+        "items": items,
+        "pending": pending,
+        "stream": running_under_gevent()
+    })
+
+
+def _sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+@app.route('/api/status/stream', methods=['GET'])
+def stream_service_status():
+    """以 SSE 推送可达性: 先发送缓存的结果，再在每个探测完成时推送，最后发送 done。"""
+    force = bool(request.args.get('refresh'))
+    cached, futures = [], []
+    for url in status_targets():
+        result = None if force else cached_status(url)
+        if result:
+            cached.append(result)
+        else:
+            futures.append(schedule_probe(url))
+
+    def generate():
+        for result in cached:
+            yield _sse('status', result)
+        try:
+            for future in as_completed(futures,
+                                       timeout=STATUS_STREAM_MAX_SECONDS):
+                try:
+                    yield _sse('status', future.result())
+                except Exception:
+                    continue
+        except FuturesTimeoutError:
+            # 未完成的探测继续在后台运行，结果写入缓存供下一次请求使用
+            pass
+        yield _sse('done', {'total': len(cached) + len(futures)})
+
+    return Response(stream_with_context(generate()),
+                    mimetype='text/event-stream',
+                    headers={
+                        'Cache-Control': 'no-cache',
+                        'X-Accel-Buffering': 'no'
+                    })
+
+
+def _build_config_summary():
+    layout = {}
+    all_groups = set()
+    try:
+        settings_data = load_yaml(HOMEPAGE_SETTINGS_PATH)
+        if settings_data and 'layout' in settings_data:
+            layout = settings_data['layout']
+    except Exception:
+        pass
+    try:
+        for group in load_yaml(HOMEPAGE_CONFIG_PATH) or []:
+            all_groups.add(list(group.keys())[0])
+    except Exception:
+        pass
+    try:
+        for column in load_yaml(HOMEPAGE_BOOKMARKS_PATH) or []:
+            all_groups.add(list(column.keys())[0])
+    except Exception:
+        pass
+    return {'groups': sorted(list(all_groups)), 'layout': layout}
+
+
+@app.route('/api/config', methods=['GET'])
+def get_config():
+    return jsonify(
+        cached_derived('config', (HOMEPAGE_SETTINGS_PATH, HOMEPAGE_CONFIG_PATH,
+                                  HOMEPAGE_BOOKMARKS_PATH),
+                       _build_config_summary))
+
+
+@app.route('/api/services', methods=['GET'])
+def get_services():
+    return _load_document(HOMEPAGE_CONFIG_PATH, 'services.yaml', [])
+
+
+@app.route('/api/services', methods=['POST'])
+def save_services():
+    return _replace_document(HOMEPAGE_CONFIG_PATH, 'services.yaml', "服务配置已成功保存！")
+
+
+@app.route('/api/services', methods=['PATCH'])
+def patch_services():
+    return _patch_document(HOMEPAGE_CONFIG_PATH, 'services.yaml', "服务配置已更新")
+
+
+@app.route('/api/bookmarks', methods=['GET'])
+def get_bookmarks():
+    return _load_document(HOMEPAGE_BOOKMARKS_PATH, 'bookmarks.yaml', [])
+
+
+@app.route('/api/bookmarks', methods=['POST'])
+def save_bookmarks():
+    return _replace_document(HOMEPAGE_BOOKMARKS_PATH, 'bookmarks.yaml', "书签配置已成功保存！")
+
+
+@app.route('/api/bookmarks', methods=['PATCH'])
+def patch_bookmarks():
+    return _patch_document(HOMEPAGE_BOOKMARKS_PATH, 'bookmarks.yaml', "书签配置已更新")
+
+
+def build_item(name, url, desc, icon, abbr):
+    item = {'name': name, 'href': url}
+    if desc: item['description'] = desc
+    if icon: item['icon'] = icon
+    if abbr: item['abbr'] = abbr
+    return item
+
+
+@app.route('/api/item/prepare', methods=['POST'])
 def prepare_item_api():
     name, url, desc, abbr = request.form.get('name'), request.form.get(
         'href'), request.form.get('description',
@@ -449,45 +3035,612 @@ def prepare_item_api():
         'icon_file'), request.form.get('icon')
     if not (name or abbr) or not url:
         return jsonify({"error": "名称/缩写和地址是必需的。"}), 400
-    temp_file_path, icon_url_for_config = None, current_icon_url if current_icon_url not in [
+    icon_url_for_config = current_icon_url if current_icon_url not in [
         None, 'null', 'undefined'
     ] else None
     try:
         if icon_file and icon_file.filename != '':
-            filename = f"{uuid.uuid4()}-{os.path.basename(icon_file.filename)}"
-            temp_file_path = os.path.join(UPLOAD_FOLDER, filename)
-            icon_file.save(temp_file_path)
+            with timed('icon_upload'):
+                # 扩展名取自文件内容而不是文件名
+                content = icon_file.stream.commit()
+                icon_url_for_config = store_icon_bytes(
+                    content, icon_file.stream.ext) or icon_url_for_config
         elif not icon_url_for_config:
-            temp_file_path = fetch_and_save_icon(url)
-        if temp_file_path:
-            if ICON_STORAGE_STRATEGY == 'minio':
-                print("策略 'minio': 正在尝试上传图标...")
-                minio_url = upload_to_minio(temp_file_path,
-                                            MINIO_ICONS_BUCKET_NAME)
-                if minio_url: icon_url_for_config = minio_url
-                else: print("MinIO 图标上传失败。")
-            elif ICON_STORAGE_STRATEGY == 'local':
-                print("策略 'local': 正在本地保存图标...")
-                local_filename = save_file_locally(temp_file_path,
-                                                   LOCAL_ICON_PATH)
-                if local_filename:
-                    icon_url_for_config = f"/icons/{local_filename}"
-            else:
-                print(f"警告: 未知策略 '{ICON_STORAGE_STRATEGY}'。将默认使用 'local'。")
-                local_filename = save_file_locally(temp_file_path,
-                                                   LOCAL_ICON_PATH)
-                if local_filename:
-                    icon_url_for_config = f"/icons/{local_filename}"
-        final_item_obj = {'name': name, 'href': url}
-        if desc: final_item_obj['description'] = desc
-        if icon_url_for_config: final_item_obj['icon'] = icon_url_for_config
-        if abbr: final_item_obj['abbr'] = abbr
+            with timed('icon_fetch'):
+                icon_url_for_config = fetch_and_store_icon(url)
+        if icon_url_for_config and icon_url_for_config != current_icon_url:
+            schedule_thumbnails('icons', icon_url_for_config)
+        with timed('build_item'):
+            final_item_obj = build_item(name, url, desc, icon_url_for_config,
+                                        abbr)
         return jsonify({"message": "项目已准备就绪", "item": final_item_obj})
+    except UPLOAD_REJECTIONS:
+        raise
     except Exception as e:
         return jsonify({"error": f"处理项目时发生未知错误: {e}"}), 500
+
+
+# 批量导入: 在有界线程池中并行准备多个项目 (抓取图标、上传存储、去重)，
+# 以 NDJSON 流式返回进度，最后一次性写入 services.yaml。
+IMPORT_WORKERS = int(os.getenv('IMPORT_WORKERS', '6'))
+import_executor = ThreadPoolExecutor(max_workers=IMPORT_WORKERS,
+                                     thread_name_prefix='item-import')
+
+
+def _ndjson(payload):
+    return json.dumps(payload, ensure_ascii=False) + '\n'
+
+
+def _existing_service_hrefs():
+    hrefs = set()
+    try:
+        for group in load_yaml(HOMEPAGE_CONFIG_PATH) or []:
+            for item in next(iter(group.values()), None) or []:
+                for details in item.values():
+                    if isinstance(details, dict) and details.get('href'):
+                        hrefs.add(details['href'].rstrip('/'))
+    except FileNotFoundError:
+        pass
+    return hrefs
+
+
+def _prepare_import_item(candidate, icons_by_origin, icons_lock):
+    url = candidate['href']
+    icon = candidate.get('icon')
+    if not icon:
+        # 同一个站点下的多个项目只抓取和存储一次图标
+        origin = _url_origin(url)
+        with icons_lock:
+            icon_future = icons_by_origin.get(origin)
+            is_owner = icon_future is None
+            if is_owner:
+                icon_future = icons_by_origin[origin] = Future()
+        if is_owner:
+            try:
+                fetched_icon = fetch_and_store_icon(url)
+            except Exception as e:
+                print(f"为 {url} 抓取图标失败: {e}")
+                fetched_icon = None
+            icon_future.set_result(fetched_icon)
+            if fetched_icon:
+                schedule_thumbnails('icons', fetched_icon)
+        icon = icon_future.result()
+    return build_item(candidate.get('name'), url,
+                      candidate.get('description', ''), icon,
+                      candidate.get('abbr', ''))
+
+
+def _valid_import_candidate(candidate):
+    """地址必须是非空字符串，名称或缩写至少有一个，且提供的文本字段都必须是字符串。"""
+    if not isinstance(candidate, dict):
+        return False
+    href = candidate.get('href')
+    if not isinstance(href, str) or not href.strip():
+        return False
+    for key in ('name', 'abbr', 'description', 'icon'):
+        if candidate.get(key) is not None and not isinstance(
+                candidate[key], str):
+            return False
+    return bool(candidate.get('name') or candidate.get('abbr'))
+
+
+def _append_service_items(group_name, items):
+    docs = [{
+        item['name'] or item.get('abbr'):
+        {k: v
+         for k, v in item.items() if k != 'name'}
+    } for item in items]
+    with config_write_lock(HOMEPAGE_CONFIG_PATH):
+        data, _ = _load_document_for_update(HOMEPAGE_CONFIG_PATH)
+        doc = copy.deepcopy(data or [])
+        group_names = [next(iter(group), None) for group in doc]
+        if group_name in group_names:
+            group_index = group_names.index(group_name)
+            ops = [{
+                'op': 'insert_item',
+                'to': [group_index],
+                'item': item_doc
+            } for item_doc in docs]
+        else:
+            ops = [{'op': 'insert_group', 'name': group_name, 'items': docs}]
+        return dump_yaml(HOMEPAGE_CONFIG_PATH,
+                         apply_document_ops(doc, ops),
+                         reason='import')
+
+
+@app.route('/api/items/import', methods=['POST'])
+def import_items_api():
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "请求体必须是 JSON 对象"}), 400
+    group_name, candidates = body.get('group'), body.get('items')
+    if not group_name or not isinstance(candidates, list) or not candidates:
+        return jsonify({"error": "服务组和待导入的项目列表是必需的。"}), 400
+
+    def generate():
+        yield _ndjson({'event': 'start', 'total': len(candidates)})
+        existing_hrefs = _existing_service_hrefs()
+        icons_by_origin, icons_lock = {}, threading.Lock()
+        futures = {}
+        prepared = [None] * len(candidates)
+        skipped = failed = 0
+        for index, candidate in enumerate(candidates):
+            if not _valid_import_candidate(candidate):
+                failed += 1
+                yield _ndjson({
+                    'event': 'item',
+                    'index': index,
+                    'status': 'failed',
+                    'error': "名称/缩写和地址是必需的，且必须是字符串。"
+                })
+                continue
+            href = candidate['href'].rstrip('/')
+            if href in existing_hrefs:
+                skipped += 1
+                yield _ndjson({
+                    'event': 'item',
+                    'index': index,
+                    'status': 'skipped',
+                    'error': "该地址已存在于 services.yaml 中"
+                })
+                continue
+            existing_hrefs.add(href)
+            futures[import_executor.submit(_prepare_import_item, candidate,
+                                           icons_by_origin,
+                                           icons_lock)] = index
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                prepared[index] = future.result()
+                yield _ndjson({
+                    'event': 'item',
+                    'index': index,
+                    'status': 'ready',
+                    'item': prepared[index]
+                })
+            except Exception as e:
+                failed += 1
+                yield _ndjson({
+                    'event': 'item',
+                    'index': index,
+                    'status': 'failed',
+                    'error': f"处理项目时发生未知错误: {e}"
+                })
+        items = [item for item in prepared if item]
+        summary = {
+            'event': 'done',
+            'added': len(items),
+            'skipped': skipped,
+            'failed': failed
+        }
+        if items:
+            try:
+                summary['revision'] = _append_service_items(group_name, items)
+            except Exception as e:
+                summary.update(added=0, error=f"写入 services.yaml 失败: {e}")
+        yield _ndjson(summary)
+
+    return Response(stream_with_context(generate()),
+                    mimetype='application/x-ndjson',
+                    headers={
+                        'Cache-Control': 'no-cache',
+                        'X-Accel-Buffering': 'no'
+                    })
+
+
+# 图标健康检查: 定期遍历 services.yaml / bookmarks.yaml 中引用的图标，用条件请求检查
+# 来源图标是否更新、存储中的文件是否丢失、外部图标地址是否失效，必要时通过当前的存储策略
+# 重新抓取并替换配置中的引用，最后找出不再被配置目录中任何 YAML 文件引用的图标文件
+# (设置 ICON_GC_ENABLED 后才会真正删除，否则只在报告中列出)。
+# 多个 worker 之间用 fcntl 文件锁保证同一时间只有一个在执行检查。
+ICON_HEALTH_INTERVAL = int(os.getenv('ICON_HEALTH_INTERVAL', str(6 * 3600)))
+ICON_HEALTH_WORKERS = int(os.getenv('ICON_HEALTH_WORKERS', '4'))
+ICON_HEALTH_POLL = 60
+ICON_GC_ENABLED = os.getenv('ICON_GC_ENABLED',
+                            'false').lower() in ('1', 'true', 'yes')
+# 刚准备好但尚未保存到配置中的图标不会被清理
+ICON_GC_GRACE = int(os.getenv('ICON_GC_GRACE', str(24 * 3600)))
+# 外部图标连续这么多次检查都失效后才替换为抓取的站点图标，0 表示只报告不替换
+ICON_EXTERNAL_REPLACE_AFTER = int(
+    os.getenv('ICON_EXTERNAL_REPLACE_AFTER', '3'))
+ICON_HEALTH_LOCK_PATH = os.path.join(DATA_DIR, '.icon_health.lock')
+ICON_HEALTH_REPORT_PATH = os.path.join(DATA_DIR, 'icon_health.json')
+_icon_health_started = False
+_icon_health_started_lock = threading.Lock()
+
+
+def _walk_icon_references(node, references):
+    if isinstance(node, list):
+        for child in node:
+            _walk_icon_references(child, references)
+    elif isinstance(node, dict):
+        icon = node.get('icon')
+        if isinstance(icon, str) and icon:
+            href = node.get('href')
+            hrefs = references.setdefault(icon, [])
+            if isinstance(href, str) and href and href not in hrefs:
+                hrefs.append(href)
+        for value in node.values():
+            if isinstance(value, (list, dict)):
+                _walk_icon_references(value, references)
+
+
+def collect_icon_references():
+    """返回 {图标地址: [引用它的条目地址, ...]}；没有任何配置文件时返回 None。"""
+    references, found = {}, False
+    for path in (HOMEPAGE_CONFIG_PATH, HOMEPAGE_BOOKMARKS_PATH):
+        try:
+            _walk_icon_references(load_yaml(path), references)
+            found = True
+        except FileNotFoundError:
+            continue
+    return references if found else None
+
+
+def _walk_strings(node, names):
+    if isinstance(node, list):
+        for child in node:
+            _walk_strings(child, names)
+    elif isinstance(node, dict):
+        for value in node.values():
+            _walk_strings(value, names)
+    elif isinstance(node, str) and node:
+        name = os.path.basename(urlparse(node.strip()).path)
+        if name:
+            names.add(name)
+            names.add(os.path.splitext(name)[0])
+
+
+def collect_referenced_icon_names():
+    """返回配置目录中所有 YAML 文件里出现过的文件名 (含去掉扩展名的形式)。
+
+    按文件名而不是完整地址匹配，换了访问地址或 MINIO_PUBLIC_ENDPOINT 的引用也能识别；
+    任何文件解析失败时抛出异常，避免误删。
+    """
+    names = set()
+    for entry in sorted(os.listdir(HOMEPAGE_CONFIG_DIR)):
+        if entry.endswith(('.yaml', '.yml')):
+            _walk_strings(load_yaml(os.path.join(HOMEPAGE_CONFIG_DIR, entry)),
+                          names)
+    return names
+
+
+def _replace_icons(node, replacements):
+    """replacements 以 (图标地址, 站点) 为键，只替换 href 属于该站点的条目。"""
+    changed = False
+    if isinstance(node, list):
+        for child in node:
+            changed = _replace_icons(child, replacements) or changed
+    elif isinstance(node, dict):
+        icon, href = node.get('icon'), node.get('href')
+        key = (icon, _url_origin(href)) if isinstance(href, str) else None
+        if key in replacements:
+            node['icon'] = replacements[key]
+            changed = True
+        for value in node.values():
+            if isinstance(value, (list, dict)):
+                changed = _replace_icons(value, replacements) or changed
+    return changed
+
+
+def replace_icon_references(replacements):
+    for path in (HOMEPAGE_CONFIG_PATH, HOMEPAGE_BOOKMARKS_PATH):
+        with config_write_lock(path):
+            data, _ = _load_document_for_update(path)
+            if data is None:
+                continue
+            doc = copy.deepcopy(data)
+            if _replace_icons(doc, replacements):
+                dump_yaml(path, doc, reason='icon-health')
+
+
+def _stored_icon_exists(name):
+    if ICON_STORAGE_STRATEGY == 'minio':
+        if not minio_client:
+            return True
+        try:
+            minio_client.stat_object(MINIO_ICONS_BUCKET_NAME, name)
+            return True
+        except S3Error as e:
+            if e.code in ('NoSuchKey', 'NoSuchObject'):
+                return False
+            raise
+    return os.path.exists(os.path.join(LOCAL_ICON_PATH, name))
+
+
+def _hrefs_by_origin(hrefs):
+    origins = {}
+    for href in hrefs:
+        origins.setdefault(_url_origin(href), href)
+    return origins
+
+
+def _refetch_icons(hrefs):
+    """为每个站点重新抓取图标，返回 {站点: 新图标地址}。"""
+    new_urls = {}
+    for origin, href in _hrefs_by_origin(hrefs).items():
+        icon_url = fetch_and_store_icon(href, refresh=True)
+        if icon_url:
+            new_urls[origin] = icon_url
+    return new_urls
+
+
+def _check_icon_origin(icon_url, origin, href):
+    """用条件请求检查站点的来源图标，返回新的图标地址；未变化或无需检查时返回 None。"""
+    source = icon_index_source(origin)
+    # 只检查由站点抓取得到的图标，手动上传的图标保持不变
+    if not source or source[0] != icon_url or not source[1]:
+        return None
+    headers = {}
+    if source[2]:
+        headers['If-None-Match'] = source[2]
+    if source[3]:
+        headers['If-Modified-Since'] = source[3]
+    fetched = _fetch_icon_candidate(source[1],
+                                    time.monotonic() + ICON_FETCH_DEADLINE,
+                                    headers)
+    if fetched == ICON_NOT_MODIFIED:
+        touch_icon_index(origin)
+        return None
+    if fetched is None:
+        # 原来的图标地址失效，重新探测站点
+        return fetch_and_store_icon(href, refresh=True)
+    new_url = store_icon_bytes(fetched.content, fetched.ext)
+    if new_url:
+        record_icon_index(origin, new_url, fetched)
+    return new_url
+
+
+def _check_stored_icon(icon_url, hrefs):
+    """检查本系统存储的图标，返回 (状态, {站点: 新图标地址})。
+
+    相同内容的图标只保存一份，多个站点可能共用同一个文件，因此逐个站点检查，
+    只替换来源图标确实发生变化的站点的引用。
+    """
+    if not _stored_icon_exists(stored_object_name('icons', icon_url)):
+        new_urls = _refetch_icons(hrefs)
+        return ('repaired', new_urls) if new_urls else ('broken', {})
+    new_urls = {}
+    for origin, href in _hrefs_by_origin(hrefs).items():
+        new_url = _check_icon_origin(icon_url, origin, href)
+        if new_url and new_url != icon_url:
+            new_urls[origin] = new_url
+    return ('refreshed' if new_urls else 'unchanged'), new_urls
+
+
+def _check_external_icon(icon_url, hrefs, previous_failures=0):
+    """检查外部图标地址是否仍然可用。
+
+    偶尔的网络故障不应改动配置，只有连续 ICON_EXTERNAL_REPLACE_AFTER 次检查都失效时
+    才改为抓取并保存站点图标，否则只报告为失效。
+    """
+    try:
+        response = http_session.head(icon_url,
+                                     timeout=(3, ICON_FETCH_DEADLINE),
+                                     allow_redirects=True)
+        if response.status_code in (405, 501):
+            with http_session.get(icon_url,
+                                  timeout=(3, ICON_FETCH_DEADLINE),
+                                  stream=True) as response:
+                pass
+        if response.status_code < 400:
+            return 'unchanged', {}
+    except requests.RequestException:
+        pass
+    if (ICON_EXTERNAL_REPLACE_AFTER > 0
+            and previous_failures + 1 >= ICON_EXTERNAL_REPLACE_AFTER):
+        new_urls = _refetch_icons(hrefs)
+        if new_urls:
+            return 'repaired', new_urls
+    return 'broken', {}
+
+
+def check_icon(icon_url, hrefs, previous_failures=0):
+    if stored_object_name('icons', icon_url):
+        return _check_stored_icon(icon_url, hrefs)
+    if urlparse(icon_url).scheme in ('http', 'https'):
+        return _check_external_icon(icon_url, hrefs, previous_failures)
+    # homepage 内置图标 (如 "sonarr.png"、"mdi-home") 无需检查
+    return 'skipped', {}
+
+
+def _is_referenced_icon(name, referenced_names):
+    name = os.path.basename(name)
+    return (name in referenced_names
+            or os.path.splitext(name)[0] in referenced_names)
+
+
+def collect_garbage_icons(referenced_names, dry_run=False):
+    """找出超过保留期且文件名不再被引用的图标并删除 (dry_run 时只列出)，返回图标地址列表。"""
+    cutoff = time.time() - ICON_GC_GRACE
+    removed = []
+    if ICON_STORAGE_STRATEGY == 'minio':
+        if not minio_client:
+            return removed
+        for obj in minio_client.list_objects(MINIO_ICONS_BUCKET_NAME,
+                                             prefix='icons/',
+                                             recursive=True):
+            if (obj.is_dir
+                    or _is_referenced_icon(obj.object_name, referenced_names)
+                    or not obj.last_modified
+                    or obj.last_modified.timestamp() > cutoff):
+                continue
+            if not dry_run:
+                minio_client.remove_object(MINIO_ICONS_BUCKET_NAME,
+                                           obj.object_name)
+            removed.append(
+                f"{MINIO_PUBLIC_ENDPOINT.rstrip('/')}/{MINIO_ICONS_BUCKET_NAME}/{obj.object_name}"
+            )
+    else:
+        with os.scandir(LOCAL_ICON_PATH) as it:
+            for entry in it:
+                if (entry.name.startswith('.') or not entry.is_file()
+                        or _is_referenced_icon(entry.name, referenced_names)
+                        or entry.stat().st_mtime > cutoff):
+                    continue
+                if not dry_run:
+                    os.remove(entry.path)
+                removed.append(f"/icons/{entry.name}")
+    if removed and not dry_run:
+        forget_icon_index_urls(removed)
+    return removed
+
+
+def run_icon_health_check():
+    """执行一次完整的检查，返回报告。"""
+    started_at = time.time()
+    references = collect_icon_references()
+    previous_failures = (load_icon_health_report()
+                         or {}).get('external_failures') or {}
+    report = {
+        'started_at': started_at,
+        'checked': 0,
+        'unchanged': 0,
+        'refreshed': 0,
+        'repaired': 0,
+        'skipped': 0,
+        'broken': [],
+        'errors': [],
+        'external_failures': {},
+        'removed': 0,
+        'gc_candidates': []
+    }
+    if references is None:
+        report['errors'].append("未找到任何配置文件，跳过检查")
+        report['finished_at'] = time.time()
+        return report
+    replacements = {}
+    with ThreadPoolExecutor(max_workers=ICON_HEALTH_WORKERS,
+                            thread_name_prefix='icon-health') as executor:
+        futures = {
+            executor.submit(check_icon, icon_url, hrefs,
+                            previous_failures.get(icon_url, 0)):
+            (icon_url, hrefs)
+            for icon_url, hrefs in references.items()
+        }
+        for future in as_completed(futures):
+            icon_url, hrefs = futures[future]
+            try:
+                status, new_urls = future.result()
+            except Exception as e:
+                report['errors'].append(f"{icon_url}: {e}")
+                continue
+            if status == 'broken':
+                report['broken'].append({'icon': icon_url, 'hrefs': hrefs})
+                if not stored_object_name('icons', icon_url):
+                    report['external_failures'][icon_url] = (
+                        previous_failures.get(icon_url, 0) + 1)
+            else:
+                report[status] += 1
+            if status != 'skipped':
+                report['checked'] += 1
+            for origin, new_url in new_urls.items():
+                replacements[(icon_url, origin)] = new_url
+    if replacements:
+        replace_icon_references(replacements)
+        for new_url in set(replacements.values()):
+            schedule_thumbnails('icons', new_url)
+    try:
+        garbage = collect_garbage_icons(collect_referenced_icon_names(),
+                                        dry_run=not ICON_GC_ENABLED)
+        if ICON_GC_ENABLED:
+            report['removed'] = len(garbage)
+        else:
+            report['gc_candidates'] = garbage
+    except Exception as e:
+        report['errors'].append(f"清理未引用的图标失败: {e}")
+    report['finished_at'] = time.time()
+    print(f"图标检查完成: 检查 {report['checked']} 个，更新 {report['refreshed']} 个，"
+          f"修复 {report['repaired']} 个，失效 {len(report['broken'])} 个，"
+          f"清理 {report['removed']} 个。")
+    return report
+
+
+def _acquire_icon_health_lock():
+    """非阻塞地获取检查锁，成功时返回文件描述符，已有 worker 在检查时返回 None。"""
+    fd = os.open(ICON_HEALTH_LOCK_PATH, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return fd
+    except BlockingIOError:
+        os.close(fd)
+        return None
+
+
+def load_icon_health_report():
+    try:
+        with open(ICON_HEALTH_REPORT_PATH, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _icon_health_due():
+    report = load_icon_health_report()
+    return not report or time.time() - report.get(
+        'finished_at', 0) >= ICON_HEALTH_INTERVAL
+
+
+def _run_icon_health_locked(lock_fd, force=False):
+    try:
+        # 拿到锁后再判断一次，其他 worker 可能刚刚完成检查
+        if not force and not _icon_health_due():
+            return
+        report = run_icon_health_check()
+        temp_path = f"{ICON_HEALTH_REPORT_PATH}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False)
+        os.replace(temp_path, ICON_HEALTH_REPORT_PATH)
+    except Exception as e:
+        print(f"图标检查失败: {e}")
     finally:
-        if temp_file_path and os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
+        os.close(lock_fd)
+
+
+def _icon_health_scheduler():
+    while True:
+        time.sleep(ICON_HEALTH_POLL)
+        if not _icon_health_due():
+            continue
+        lock_fd = _acquire_icon_health_lock()
+        if lock_fd is not None:
+            _run_icon_health_locked(lock_fd)
+
+
+@app.before_request
+def _ensure_icon_health_scheduler():
+    global _icon_health_started
+    if _icon_health_started or ICON_HEALTH_INTERVAL <= 0:
+        return
+    with _icon_health_started_lock:
+        if not _icon_health_started:
+            _icon_health_started = True
+            threading.Thread(target=_icon_health_scheduler,
+                             name='icon-health',
+                             daemon=True).start()
+
+
+@app.route('/api/icons/health', methods=['GET'])
+def get_icon_health():
+    lock_fd = _acquire_icon_health_lock()
+    if lock_fd is not None:
+        os.close(lock_fd)
+    return jsonify({
+        "running": lock_fd is None,
+        "report": load_icon_health_report()
+    })
+
+
+@app.route('/api/icons/health', methods=['POST'])
+def start_icon_health_check():
+    lock_fd = _acquire_icon_health_lock()
+    if lock_fd is None:
+        return jsonify({"error": "图标检查正在进行中，请稍后再试"}), 409
+    threading.Thread(target=_run_icon_health_locked,
+                     args=(lock_fd, True),
+                     name='icon-health-manual',
+                     daemon=True).start()
+    return jsonify({"message": "图标检查已开始"}), 202
 
 
 if __name__ == '__main__':
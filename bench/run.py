@@ -0,0 +1,375 @@
+"""编辑器 API 基准测试: 一条命令生成合成配置、启动上游替身与服务，并发压测各接口，
+输出 p50/p99 延迟、吞吐量与服务进程内存。
+
+    python bench/run.py                         # 默认 10/500/5000 个条目
+    python bench/run.py --sizes 100 --requests 400 --concurrency 16
+    python bench/run.py --server gunicorn --json result.json
+
+使用本地存储策略 (ICON_STORAGE_STRATEGY=local)，所有数据写在临时目录中。
+"""
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import yaml
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stub_server import start_stub_server  # noqa: E402
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GROUP_SIZE = 25
+
+
+def generate_config(config_dir, items, stub_url):
+    """生成 services.yaml / bookmarks.yaml / settings.yaml，条目平均分布在多个组中。"""
+    services = []
+    for start in range(0, items, GROUP_SIZE):
+        services.append({
+            f"Group {start // GROUP_SIZE}": [{
+                f"Service {i}": {
+                    'href': f"{stub_url}/site/{i}/",
+                    'description': f"Synthetic service number {i}",
+                    'icon': f"/icons/{i:032x}.png"
+                }
+            } for i in range(start, min(start + GROUP_SIZE, items))]
+        })
+    bookmarks = []
+    for start in range(0, items, GROUP_SIZE):
+        bookmarks.append({
+            f"Column {start // GROUP_SIZE}": [{
+                f"Bookmark {i}": [{
+                    'abbr': f"B{i % 100}",
+                    'href': f"https://bookmark-{i}.example.com/"
+                }]
+            } for i in range(start, min(start + GROUP_SIZE, items))]
+        })
+    settings = {
+        'title': 'Benchmark',
+        'layout': {
+            f"Group {g}": {
+                'style': 'row',
+                'columns': 4
+            }
+            for g in range(0, max(items // GROUP_SIZE, 1))
+        }
+    }
+    for name, data in (('services.yaml', services),
+                       ('bookmarks.yaml', bookmarks), ('settings.yaml',
+                                                       settings)):
+        with open(os.path.join(config_dir, name), 'w',
+                  encoding='utf-8') as f:
+            yaml.safe_dump(data, f, allow_unicode=True, sort_keys=False)
+
+
+def jpeg_bytes(size, seed):
+    """生成约 size 字节的 JPEG (噪声图像难以压缩，体积接近目标)。"""
+    rng = random.Random(seed)
+    side = max(int((size / 1.2)**0.5), 16)
+    image = Image.frombytes('RGB', (side, side),
+                            bytes(rng.getrandbits(8)
+                                  for _ in range(side * side * 3)))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=95)
+    return buffer.getvalue()
+
+
+def generate_backgrounds(data_dir, count):
+    directory = os.path.join(data_dir, 'backgrounds')
+    os.makedirs(directory, exist_ok=True)
+    content = jpeg_bytes(20 * 1024, 0)
+    for i in range(count):
+        with open(os.path.join(directory, f"{i:016x}-bg-{i}.jpg"), 'wb') as f:
+            f.write(content)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def process_tree_rss(pid):
+    """进程及其子进程 (gunicorn worker) 的 RSS 总和 (字节)，仅支持 Linux。"""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(entry))
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        pending.extend(children.get(current, []))
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            pass
+    return total
+
+
+class AppServer:
+    """在子进程中运行被测服务，避免与压测客户端共享内存与 GIL。"""
+
+    def __init__(self, mode, workers, env):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        env = dict(os.environ, **env)
+        if mode == 'gunicorn':
+            env.update(BIND=f"127.0.0.1:{self.port}",
+                       WEB_CONCURRENCY=str(workers))
+            command = [
+                sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+                'app:app'
+            ]
+        else:
+            command = [
+                sys.executable, '-c',
+                'import sys, app; from werkzeug.serving import run_simple; '
+                'run_simple("127.0.0.1", int(sys.argv[1]), app.app, '
+                'threaded=True)',
+                str(self.port)
+            ]
+        self.process = subprocess.Popen(command,
+                                        cwd=REPO_ROOT,
+                                        env=env,
+                                        stdout=subprocess.DEVNULL,
+                                        stderr=subprocess.DEVNULL)
+
+    def wait_ready(self, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError("被测服务启动失败")
+            try:
+                requests.get(f"{self.url}/api/config", timeout=1)
+                return
+            except requests.RequestException:
+                time.sleep(0.2)
+        raise RuntimeError("等待被测服务启动超时")
+
+    def rss(self):
+        return process_tree_rss(self.process.pid)
+
+    def stop(self):
+        self.process.send_signal(signal.SIGTERM)
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def run_scenario(name, make_request, total, concurrency):
+    """并发执行 total 次请求，make_request(session, i) 返回 (成功与否, 字节数)。"""
+    local = threading.local()
+    latencies, errors, transferred = [], [0], [0]
+    lock = threading.Lock()
+
+    def one(i):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            ok, size = make_request(session, i)
+        except requests.RequestException:
+            ok, size = False, 0
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            transferred[0] += size
+            if not ok:
+                errors[0] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(total)))
+    wall = time.perf_counter() - started
+    return {
+        'scenario': name,
+        'requests': total,
+        'errors': errors[0],
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'rps': total / wall,
+        'mb_per_s': transferred[0] / wall / 1024 / 1024,
+    }
+
+
+def build_scenarios(base, stub_port, upload_bytes):
+    services_doc = {}
+
+    def get(path):
+
+        def request(session, i):
+            response = session.get(f"{base}{path}", timeout=60)
+            return response.ok, len(response.content)
+
+        return request
+
+    def post_services(session, i):
+        if 'doc' not in services_doc:
+            services_doc['doc'] = session.get(f"{base}/api/services",
+                                              timeout=60).json()
+        response = session.post(f"{base}/api/services",
+                                json=services_doc['doc'],
+                                timeout=60)
+        return response.ok, 0
+
+    def prepare_item(session, i):
+        # 每个请求使用不同的回环地址，使图标索引不命中，测量完整的图标抓取流程
+        host = f"127.{(i // 250) % 250 + 1}.{i % 250 + 1}.1"
+        response = session.post(f"{base}/api/item/prepare",
+                                data={
+                                    'name': f"Bench {i}",
+                                    'href': f"http://{host}:{stub_port}/site/{i}/"
+                                },
+                                timeout=60)
+        return response.ok and 'item' in response.json(), 0
+
+    upload = jpeg_bytes(upload_bytes, 1)
+
+    def upload_background(session, i):
+        response = session.post(f"{base}/api/backgrounds/upload",
+                                files={
+                                    'file':
+                                    (f"bench-{i}.jpg", upload, 'image/jpeg')
+                                },
+                                timeout=120)
+        return response.ok, len(upload)
+
+    return [
+        ('GET /api/config', get('/api/config')),
+        ('GET /api/services', get('/api/services')),
+        ('POST /api/services', post_services),
+        ('GET /api/backgrounds', get('/api/backgrounds?limit=60')),
+        ('GET /api/docker/containers', get('/api/docker/containers')),
+        ('GET /api/lucky/proxies', get('/api/lucky/proxies')),
+        ('POST /api/item/prepare', prepare_item),
+        ('POST /api/backgrounds/upload', upload_background),
+    ]
+
+
+def benchmark_size(items, args, stub_port):
+    workdir = tempfile.mkdtemp(prefix='homepage-bench-')
+    config_dir = os.path.join(workdir, 'config')
+    data_dir = os.path.join(workdir, 'data')
+    os.makedirs(config_dir)
+    os.makedirs(data_dir)
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    generate_config(config_dir, items, stub_url)
+    generate_backgrounds(data_dir, args.backgrounds)
+    server = AppServer(
+        args.server, args.workers, {
+            'HOMEPAGE_CONFIG_DIR': config_dir,
+            'DATA_DIR': data_dir,
+            'ICON_STORAGE_STRATEGY': 'local',
+            'DOCKER_API_ENDPOINT': f"{stub_url}/docker",
+            'LUCKY_API_ENDPOINT': f"{stub_url}/lucky",
+            'LUCKY_API_TOKEN': 'bench',
+        })
+    results = []
+    try:
+        server.wait_ready()
+        idle_rss = server.rss()
+        peak_rss = idle_rss
+        for name, make_request in build_scenarios(server.url, stub_port,
+                                                  args.upload_kb * 1024):
+            if args.only and not any(k in name for k in args.only):
+                continue
+            total = args.requests
+            if 'prepare' in name or 'upload' in name:
+                total = max(total // 4, 1)
+            result = run_scenario(name, make_request, total,
+                                  args.concurrency)
+            result['items'] = items
+            results.append(result)
+            peak_rss = max(peak_rss, server.rss())
+            print_result(result)
+        print(f"  内存: 启动后 {idle_rss / 1048576:.1f} MiB，"
+              f"压测中最高 {peak_rss / 1048576:.1f} MiB")
+        for result in results:
+            result['idle_rss_mb'] = idle_rss / 1048576
+            result['peak_rss_mb'] = peak_rss / 1048576
+    finally:
+        server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def print_result(result):
+    throughput = (f" {result['mb_per_s']:8.1f} MiB/s"
+                  if 'upload' in result['scenario'] else '')
+    print(f"  {result['scenario']:<32} n={result['requests']:<5} "
+          f"err={result['errors']:<3} p50={result['p50_ms']:8.1f}ms "
+          f"p99={result['p99_ms']:8.1f}ms {result['rps']:8.1f} req/s"
+          f"{throughput}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--sizes',
+                        type=int,
+                        nargs='+',
+                        default=[10, 500, 5000],
+                        help='合成配置中的条目数')
+    parser.add_argument('--requests', type=int, default=200, help='每个场景的请求数')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--server',
+                        choices=['gunicorn', 'werkzeug'],
+                        default='gunicorn'
+                        if shutil.which('gunicorn') else 'werkzeug')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn worker 数')
+    parser.add_argument('--backgrounds', type=int, default=300, help='背景图片数量')
+    parser.add_argument('--upload-kb', type=int, default=2048, help='上传背景图片的大小')
+    parser.add_argument('--icon-delay',
+                        type=float,
+                        default=0.2,
+                        help='替身网站返回 favicon 前的延迟 (秒)')
+    parser.add_argument('--only', nargs='+', help='只运行名称包含这些关键字的场景')
+    parser.add_argument('--json', help='把结果写入 JSON 文件，便于对比')
+    args = parser.parse_args()
+
+    stub, stub_port = start_stub_server(icon_delay=args.icon_delay)
+    print(f"服务器: {args.server}，并发: {args.concurrency}")
+    results = []
+    try:
+        for items in args.sizes:
+            print(f"\n条目数 {items}:")
+            results.extend(benchmark_size(items, args, stub_port))
+    finally:
+        stub.shutdown()
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
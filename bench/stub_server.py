@@ -0,0 +1,124 @@
+"""基准测试用的上游替身: 慢速的网站 (首页 + favicon)、Docker API 与 Lucky API。
+
+可单独运行: python bench/stub_server.py --port 18080
+"""
+import argparse
+import io
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+
+def _png_bytes(color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class StubState:
+
+    def __init__(self, containers=50, lucky_rules=50, page_delay=0.05,
+                 icon_delay=0.2):
+        self.page_delay = page_delay
+        self.icon_delay = icon_delay
+        self.icon = _png_bytes((40, 120, 200))
+        self.containers = json.dumps([{
+            'Id': f"{i:064x}",
+            'Names': [f"/service-{i}"],
+            'Image': f"example/service-{i % 7}:latest",
+            'State': 'running' if i % 5 else 'exited',
+            'Ports': [{
+                'PrivatePort': 80,
+                'PublicPort': 10000 + i,
+                'Type': 'tcp'
+            }]
+        } for i in range(containers)]).encode('utf-8')
+        self.lucky = json.dumps({
+            'ret':
+            0,
+            'ruleList': [{
+                'RuleName':
+                'bench',
+                'ProxyList': [{
+                    'Enable': True,
+                    'Remark': f"rule-{i}",
+                    'Domains': [f"rule-{i}.example.com"],
+                    'Locations': [f"http://192.168.1.{i % 250 + 1}:8080"]
+                } for i in range(lucky_rules)]
+            }]
+        }).encode('utf-8')
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path == '/docker/containers/json':
+            self._send(200, self.state.containers, 'application/json')
+        elif path == '/lucky/api/webservice/rules':
+            self._send(200, self.state.lucky, 'application/json')
+        elif path.endswith('/favicon.png') or path.endswith('/favicon.ico'):
+            time.sleep(self.state.icon_delay)
+            self._send(200, self.state.icon, 'image/png')
+        elif path.startswith('/site/') or path == '/':
+            time.sleep(self.state.page_delay)
+            body = ('<html><head><title>bench</title>'
+                    '<link rel="icon" href="favicon.png"></head>'
+                    '<body></body></html>').encode('utf-8')
+            self._send(200, body, 'text/html; charset=utf-8')
+        else:
+            self._send(404, b'not found', 'text/plain')
+
+    do_HEAD = do_GET
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # 图标抓取会在读到足够内容后提前断开连接，属于正常情况
+        if isinstance(sys.exc_info()[1], (ConnectionError, TimeoutError)):
+            return
+        super().handle_error(request, client_address)
+
+
+def start_stub_server(port=0, **options):
+    """在后台线程中启动替身服务器，返回 (server, 端口)。"""
+    handler = type('BoundStubHandler', (StubHandler, ),
+                   {'state': StubState(**options)})
+    server = _StubServer(('0.0.0.0', port), handler)
+    threading.Thread(target=server.serve_forever,
+                     name='bench-stub',
+                     daemon=True).start()
+    return server, server.server_address[1]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--icon-delay', type=float, default=0.2)
+    args = parser.parse_args()
+    server, port = start_stub_server(args.port, icon_delay=args.icon_delay)
+    print(f"替身服务器已启动: http://127.0.0.1:{port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,32 @@
+import os
+import shutil
+
+# 服务模式:
+#   sync     - 每个 worker 同时只处理一个请求 (默认)
+#   threaded - 每个 worker 使用线程池处理请求 (gthread)
+#   async    - 每个 worker 使用 gevent 协程处理大量并发连接，
+#              适合 Docker/Lucky/图标抓取等慢速上游较多的场景
+SERVER_MODE = os.environ.get('SERVER_MODE', 'sync').lower()
+
+bind = os.environ.get('BIND', '0.0.0.0:3211')
+workers = int(os.environ.get('WEB_CONCURRENCY', '4'))
+
+if SERVER_MODE == 'threaded':
+    worker_class = 'gthread'
+    threads = int(os.environ.get('WEB_THREADS', '8'))
+elif SERVER_MODE == 'async':
+    worker_class = 'gevent'
+    worker_connections = int(os.environ.get('WORKER_CONNECTIONS', '1000'))
+elif SERVER_MODE != 'sync':
+    raise ValueError(f"未知的 SERVER_MODE: {SERVER_MODE}")
+
+# 慢速上游请求有自己的超时，这里只需兜底
+timeout = int(os.environ.get('WEB_TIMEOUT', '60'))
+
+
+def on_starting(server):
+    # 每次启动时清空各 worker 的指标快照，指标计数从零开始
+    data_dir = os.environ.get('DATA_DIR', '/app/data')
+    shutil.rmtree(os.environ.get('METRICS_DIR',
+                                 os.path.join(data_dir, 'metrics')),
+                  ignore_errors=True)
@@ -13,6 +13,10 @@ const app = createApp({
     const isEditMode = ref(false);
     const currentEditInfo = ref({});
     const fileInput = ref(null);
+    // 各配置文档的修订号 (ETag)，用于增量保存时检测并发修改
+    const revisions = { service: null, bookmark: null };
+    // 书签文档中每个分类恰好只有一个条目时，前端展开后的索引与文档一致，可以使用增量保存
+    let bookmarksPatchable = false;
 
     const dockerDialogVisible = ref(false);
     const isDockerLoading = ref(false);
@@ -23,6 +27,15 @@ const app = createApp({
     const isLuckyLoading = ref(false);
     const luckyProxies = ref([]);
     const luckySearchQuery = ref("");
+    const luckyShowAll = ref(false);
+    const luckyStatusLabels = { new: "新增", changed: "有变化", unchanged: "已导入" };
+
+    // 批量导入
+    const dockerSelection = ref([]);
+    const luckySelection = ref([]);
+    const importGroup = ref("");
+    const isImporting = ref(false);
+    const importProgress = ref({ done: 0, total: 0 });
 
     const backgroundDialogVisible = ref(false);
     const isSavingBackground = ref(false);
@@ -30,6 +43,15 @@ const app = createApp({
     const backgroundForm = ref({ image: "", saturate: 100, opacity: 100, blur: "" });
     const backgroundFileInput = ref(null);
     const backgroundList = ref([]);
+    const backgroundNextCursor = ref(null);
+    const backgroundSearchQuery = ref("");
+    const isLoadingBackgrounds = ref(false);
+    // 服务可达性: 地址 -> 探测结果，异步模式下由 /api/status/stream 推送，否则轮询 /api/status
+    const serviceStatus = ref({});
+    let statusSource = null;
+    let statusPollTimer = null;
+    const STATUS_POLL_INTERVAL = 3000;
+    const STATUS_POLL_LIMIT = 10;
     const blurOptions = ref([
       { value: "sm", label: "小 (sm)" },
       { value: "md", label: "中 (md)" },
@@ -54,6 +76,9 @@ const app = createApp({
       return luckyProxies.value.filter((p) => p.Name.toLowerCase().includes(query) || p.Url.toLowerCase().includes(query));
     });
 
+    // 书签文件中每个分类只有一个条目时，客户端的扁平列表与文件结构一一对应，才能增量修改
+    const isBookmarksPatchable = (data) => (data || []).every((c) => (Object.values(c)[0] || []).every((catObj) => (Object.values(catObj)[0] || []).length === 1));
+
     // API
     const fetchConfig = async () => {
       try {
@@ -68,9 +93,11 @@ const app = createApp({
         const response = await fetch(`/api/${type}s`);
         const data = await response.json();
         if (data.error) throw new Error(data.error);
+        revisions[type] = response.headers.get("ETag");
         if (type === "service") {
           services.value = (data || []).map((g) => ({ name: Object.keys(g)[0], items: (Object.values(g)[0] || []).map((i) => ({ name: Object.keys(i)[0], ...Object.values(i)[0] })) }));
         } else {
+          bookmarksPatchable = isBookmarksPatchable(data);
           bookmarks.value = (data || []).map((c) => {
             const colName = Object.keys(c)[0];
             const cats = Object.values(c)[0] || [];
@@ -126,10 +153,41 @@ const app = createApp({
           return { [c.name]: Object.keys(cats).map((catName) => ({ [catName]: cats[catName] })) };
         });
       }
+      await sendDocument(type, "POST", dataToSave);
+    };
+    const serviceItemDoc = ({ name, ...rest }) => ({ [name]: rest });
+    const bookmarkItemDoc = (i) => {
+      const details = { href: i.href };
+      if (i.abbr) details.abbr = i.abbr;
+      if (i.icon) details.icon = i.icon;
+      return { [i._categoryName]: [details] };
+    };
+    const itemDoc = (type, item) => (type === "service" ? serviceItemDoc(item) : bookmarkItemDoc(item));
+    // 增量保存: 只把操作发送给服务器，书签结构无法一一对应时回退为整体保存
+    const patchData = async (type, ops) => {
+      if (type === "bookmark" && !bookmarksPatchable) return saveData(type);
+      await sendDocument(type, "PATCH", { ops });
+    };
+    // 同一文档的保存请求依次发送，保证每个请求都带上前一个响应返回的修订号
+    const sendQueues = { service: Promise.resolve(), bookmark: Promise.resolve() };
+    const sendDocument = (type, method, body) => {
+      sendQueues[type] = sendQueues[type].then(() => sendDocumentNow(type, method, body));
+      return sendQueues[type];
+    };
+    const sendDocumentNow = async (type, method, body) => {
+      const headers = { "Content-Type": "application/json" };
+      if (revisions[type]) headers["If-Match"] = revisions[type];
       try {
-        const r = await fetch(`/api/${type}s`, { method: "POST", headers: { "Content-Type": "application/json" }, body: JSON.stringify(dataToSave, null, 2) });
+        const r = await fetch(`/api/${type}s`, { method, headers, body: JSON.stringify(body) });
         const result = await r.json();
+        if (r.status === 412) {
+          ElMessage.warning("配置已被其他编辑者修改，已重新加载最新内容，请重新操作。");
+          await fetchAllData();
+          return;
+        }
         if (!r.ok) throw new Error(result.error || "未知错误");
+        revisions[type] = r.headers.get("ETag");
+        if (type === "bookmark" && method === "POST") bookmarksPatchable = isBookmarksPatchable(body);
         ElMessage.success(`${type} 配置已成功保存！`);
       } catch (e) {
         ElMessage.error(`保存失败: ${e.message}`);
@@ -145,9 +203,10 @@ const app = createApp({
           ...opts,
           handle: ".group-title",
           onEnd: (e) => {
+            if (e.oldIndex === e.newIndex) return;
             const [m] = services.value.splice(e.oldIndex, 1);
             services.value.splice(e.newIndex, 0, m);
-            saveData("service");
+            patchData("service", [{ op: "move_group", from: e.oldIndex, to: e.newIndex }]);
           },
         });
       document.querySelectorAll('.sortable-container[data-type="service"]').forEach((el) => {
@@ -155,9 +214,12 @@ const app = createApp({
           ...opts,
           group: "service-items",
           onEnd: (e) => {
-            const [m] = services.value[e.from.dataset.groupIndex].items.splice(e.oldIndex, 1);
-            services.value[e.to.dataset.groupIndex].items.splice(e.newIndex, 0, m);
-            saveData("service");
+            const from = Number(e.from.dataset.groupIndex);
+            const to = Number(e.to.dataset.groupIndex);
+            if (from === to && e.oldIndex === e.newIndex) return;
+            const [m] = services.value[from].items.splice(e.oldIndex, 1);
+            services.value[to].items.splice(e.newIndex, 0, m);
+            patchData("service", [{ op: "move_item", from: [from, e.oldIndex], to: [to, e.newIndex] }]);
           },
         });
       });
@@ -167,9 +229,10 @@ const app = createApp({
           ...opts,
           handle: ".bookmarks-column-title",
           onEnd: (e) => {
+            if (e.oldIndex === e.newIndex) return;
             const [m] = bookmarks.value.splice(e.oldIndex, 1);
             bookmarks.value.splice(e.newIndex, 0, m);
-            saveData("bookmark");
+            patchData("bookmark", [{ op: "move_group", from: e.oldIndex, to: e.newIndex }]);
           },
         });
       document.querySelectorAll('.sortable-container[data-type="bookmark-item"]').forEach((el) => {
@@ -177,9 +240,12 @@ const app = createApp({
           ...opts,
           group: "bookmark-items",
           onEnd: (e) => {
-            const [m] = bookmarks.value[e.from.dataset.colIndex].items.splice(e.oldIndex, 1);
-            bookmarks.value[e.to.dataset.colIndex].items.splice(e.newIndex, 0, m);
-            saveData("bookmark");
+            const from = Number(e.from.dataset.colIndex);
+            const to = Number(e.to.dataset.colIndex);
+            if (from === to && e.oldIndex === e.newIndex) return;
+            const [m] = bookmarks.value[from].items.splice(e.oldIndex, 1);
+            bookmarks.value[to].items.splice(e.newIndex, 0, m);
+            patchData("bookmark", [{ op: "move_item", from: [from, e.oldIndex], to: [to, e.newIndex] }]);
           },
         });
       });
@@ -216,7 +282,7 @@ const app = createApp({
         .then(() => {
           if (type === "bookmark") bookmarks.value[colIndex].items.splice(itemIndex, 1);
           else services.value[colIndex].items.splice(itemIndex, 1);
-          saveData(type);
+          patchData(type, [{ op: "delete_item", at: [colIndex, itemIndex] }]);
           ElMessage.success("项目已删除");
         })
         .catch(() => {});
@@ -232,26 +298,30 @@ const app = createApp({
         if (!prepRes.ok) throw new Error(prepResult.error || "准备项目数据时出错");
         const item = prepResult.item;
         const type = isEditMode.value ? currentEditInfo.value.type : addForm.value.type;
+        const ops = [];
         if (isEditMode.value) {
           const { colIndex, itemIndex } = currentEditInfo.value;
+          const target = type === "bookmark" ? bookmarks.value[colIndex].items[itemIndex] : services.value[colIndex].items[itemIndex];
           if (type === "bookmark") {
-            Object.assign(bookmarks.value[colIndex].items[itemIndex], { _categoryName: item.name, abbr: item.abbr, href: item.href, icon: item.icon });
+            Object.assign(target, { _categoryName: item.name, abbr: item.abbr, href: item.href, icon: item.icon });
           } else {
-            Object.assign(services.value[colIndex].items[itemIndex], item);
+            Object.assign(target, item);
           }
+          ops.push({ op: "replace_item", at: [colIndex, itemIndex], item: itemDoc(type, target) });
         } else {
-          if (type === "bookmark") {
-            const newItem = { _categoryName: item.name, abbr: item.abbr || item.name, href: item.href, icon: item.icon };
-            let col = bookmarks.value.find((c) => c.name === addForm.value.column);
-            if (col) col.items.push(newItem);
-            else bookmarks.value.push({ name: addForm.value.column, items: [newItem] });
+          const list = type === "bookmark" ? bookmarks.value : services.value;
+          const groupName = type === "bookmark" ? addForm.value.column : addForm.value.group;
+          const newItem = type === "bookmark" ? { _categoryName: item.name, abbr: item.abbr || item.name, href: item.href, icon: item.icon } : item;
+          const groupIndex = list.findIndex((g) => g.name === groupName);
+          if (groupIndex >= 0) {
+            list[groupIndex].items.push(newItem);
+            ops.push({ op: "insert_item", to: [groupIndex], item: itemDoc(type, newItem) });
           } else {
-            let group = services.value.find((g) => g.name === addForm.value.group);
-            if (group) group.items.push(item);
-            else services.value.push({ name: addForm.value.group, items: [item] });
+            list.push({ name: groupName, items: [newItem] });
+            ops.push({ op: "insert_group", name: groupName, items: [itemDoc(type, newItem)] });
           }
         }
-        await saveData(type);
+        await patchData(type, ops);
         addDialogVisible.value = false;
         await nextTick(initAllSortables);
       } catch (e) {
@@ -263,13 +333,15 @@ const app = createApp({
     const openDockerDialog = async () => {
       dockerDialogVisible.value = true;
       dockerSearchQuery.value = "";
+      dockerSelection.value = [];
+      if (!importGroup.value && serviceGroupNames.value.length > 0) importGroup.value = serviceGroupNames.value[0];
       fetchDockerContainers();
     };
-    const fetchDockerContainers = async () => {
+    const fetchDockerContainers = async (refresh = false) => {
       isDockerLoading.value = true;
       dockerContainers.value = [];
       try {
-        const r = await fetch("/api/docker/containers");
+        const r = await fetch(refresh ? "/api/docker/containers?refresh=1" : "/api/docker/containers");
         const result = await r.json();
         if (!r.ok) throw new Error(result.error || "获取容器列表失败");
         dockerContainers.value = result;
@@ -279,6 +351,59 @@ const app = createApp({
         isDockerLoading.value = false;
       }
     };
+    const dockerCandidate = (container) => {
+      const urls = container.suggested_urls || [];
+      let desc = `从 Docker 导入, 镜像: ${container.Image}`;
+      if (urls.length > 1) {
+        desc += `。其他可用地址: ${urls.slice(1).join(", ")}`;
+      }
+      return { name: container.Name, href: urls.length > 0 ? urls[0] : "", description: desc };
+    };
+    const luckyCandidate = (proxy) => ({ name: proxy.Name, href: proxy.Url, description: `内网地址: ${proxy.LanUrl}` });
+    const runBatchImport = async (candidates, dialogVisible) => {
+      if (!importGroup.value) return ElMessage.warning("请先选择或填写要导入到的服务组");
+      const items = candidates.filter((c) => c.href);
+      if (!items.length) return ElMessage.warning("所选项目中没有可用的地址");
+      isImporting.value = true;
+      importProgress.value = { done: 0, total: items.length };
+      let summary = null;
+      try {
+        const r = await fetch("/api/items/import", { method: "POST", headers: { "Content-Type": "application/json" }, body: JSON.stringify({ group: importGroup.value, items }) });
+        if (!r.ok) throw new Error((await r.json()).error || "批量导入失败");
+        const reader = r.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        for (;;) {
+          const { value, done } = await reader.read();
+          if (done) break;
+          buffer += decoder.decode(value, { stream: true });
+          const lines = buffer.split("\n");
+          buffer = lines.pop();
+          lines.filter((l) => l.trim()).forEach((line) => {
+            const event = JSON.parse(line);
+            if (event.event === "item") importProgress.value.done += 1;
+            else if (event.event === "done") summary = event;
+          });
+        }
+        if (!summary) throw new Error("导入过程中连接中断");
+        if (summary.error) throw new Error(summary.error);
+        ElMessage.success(`导入完成: 新增 ${summary.added} 个, 跳过 ${summary.skipped} 个, 失败 ${summary.failed} 个`);
+        dialogVisible.value = false;
+        await fetchAllData();
+      } catch (e) {
+        ElMessage.error(`批量导入失败: ${e.message}`);
+      } finally {
+        isImporting.value = false;
+      }
+    };
+    const importDockerSelection = () => runBatchImport(dockerSelection.value.map(dockerCandidate), dockerDialogVisible);
+    const importLuckySelection = () => runBatchImport(luckySelection.value.map(luckyCandidate), luckyDialogVisible);
+    const handleDockerSelectionChange = (rows) => {
+      dockerSelection.value = rows;
+    };
+    const handleLuckySelectionChange = (rows) => {
+      luckySelection.value = rows;
+    };
     const handleDockerImport = (container) => {
       dockerDialogVisible.value = false;
       const urls = container.suggested_urls || [];
@@ -297,13 +422,15 @@ const app = createApp({
     const openLuckyDialog = async () => {
       luckyDialogVisible.value = true;
       luckySearchQuery.value = "";
+      luckySelection.value = [];
+      if (!importGroup.value && serviceGroupNames.value.length > 0) importGroup.value = serviceGroupNames.value[0];
       fetchLuckyProxies();
     };
     const fetchLuckyProxies = async () => {
       isLuckyLoading.value = true;
       luckyProxies.value = [];
       try {
-        const r = await fetch("/api/lucky/proxies");
+        const r = await fetch(luckyShowAll.value ? "/api/lucky/proxies?all=1" : "/api/lucky/proxies");
         const result = await r.json();
         if (!r.ok) throw new Error(result.error || "获取Lucky代理列表失败");
         luckyProxies.value = result;
@@ -333,16 +460,30 @@ const app = createApp({
     };
 
     // 背景
-    const openBackgroundDialog = async () => {
-      await fetchSettings();
+    // 分页加载背景列表，append 为 true 时追加下一页
+    const fetchBackgrounds = async (append = false) => {
+      isLoadingBackgrounds.value = true;
       try {
-        const r = await fetch("/api/backgrounds");
+        const params = new URLSearchParams();
+        if (backgroundSearchQuery.value) params.set("q", backgroundSearchQuery.value);
+        if (append && backgroundNextCursor.value) params.set("cursor", backgroundNextCursor.value);
+        const r = await fetch(`/api/backgrounds?${params}`);
         if (!r.ok) throw new Error("无法加载背景列表");
-        backgroundList.value = await r.json();
+        const page = await r.json();
+        backgroundList.value = append ? backgroundList.value.concat(page.items) : page.items;
+        backgroundNextCursor.value = page.next_cursor;
       } catch (e) {
         ElMessage.error(e.message);
-        backgroundList.value = [];
+        if (!append) backgroundList.value = [];
+      } finally {
+        isLoadingBackgrounds.value = false;
       }
+    };
+    const loadMoreBackgrounds = () => fetchBackgrounds(true);
+    const openBackgroundDialog = async () => {
+      await fetchSettings();
+      backgroundSearchQuery.value = "";
+      await fetchBackgrounds();
       if (backgroundFileInput.value) backgroundFileInput.value.value = "";
       backgroundDialogVisible.value = true;
     };
@@ -360,7 +501,7 @@ const app = createApp({
         const result = await r.json();
         if (!r.ok) throw new Error(result.error || "上传失败");
         backgroundForm.value.image = result.url;
-        backgroundList.value.unshift({ url: result.url, name: file.name });
+        backgroundList.value.unshift({ url: result.url, thumb: result.thumb, name: file.name });
         ElMessage.success("上传成功！");
       } catch (e) {
         ElMessage.error(e.message);
@@ -414,7 +555,62 @@ const app = createApp({
       }
     );
 
-    onMounted(fetchAllData);
+    const streamServiceStatus = (refresh = false) => {
+      if (statusSource) statusSource.close();
+      statusSource = new EventSource(`/api/status/stream${refresh ? "?refresh=1" : ""}`);
+      statusSource.addEventListener("status", (event) => {
+        const result = JSON.parse(event.data);
+        serviceStatus.value = { ...serviceStatus.value, [result.url]: result };
+      });
+      statusSource.addEventListener("done", () => {
+        statusSource.close();
+        statusSource = null;
+      });
+      statusSource.onerror = () => {
+        if (statusSource) statusSource.close();
+        statusSource = null;
+      };
+    };
+
+    // 同步/多线程模式下 SSE 会长时间占用 worker，改为有次数上限的轮询
+    const watchServiceStatus = async (attempt = 0) => {
+      statusPollTimer = null;
+      try {
+        const r = await fetch("/api/status");
+        const data = await r.json();
+        if (data.error) throw new Error(data.error);
+        serviceStatus.value = { ...serviceStatus.value, ...data.items };
+        if (!data.pending) return;
+        if (data.stream) {
+          streamServiceStatus();
+        } else if (attempt < STATUS_POLL_LIMIT) {
+          statusPollTimer = setTimeout(() => watchServiceStatus(attempt + 1), STATUS_POLL_INTERVAL);
+        }
+      } catch (e) {
+        console.error("获取服务状态失败:", e);
+      }
+    };
+
+    const statusClass = (url) => {
+      const result = serviceStatus.value[url];
+      if (!result) return "status-unknown";
+      return result.up ? "status-up" : "status-down";
+    };
+
+    const statusTitle = (url) => {
+      const result = serviceStatus.value[url];
+      if (!result) return "检测中…";
+      if (!result.up) return result.status ? `不可用 (HTTP ${result.status})` : `不可达 (${result.error || "超时"})`;
+      return `在线 (HTTP ${result.status}, ${result.latency_ms} ms)`;
+    };
+
+    onMounted(async () => {
+      await fetchAllData();
+      watchServiceStatus();
+      setInterval(() => {
+        if (!document.hidden && !statusSource && !statusPollTimer) watchServiceStatus();
+      }, 60000);
+    });
 
     return {
       services,
@@ -438,25 +634,47 @@ const app = createApp({
       dockerSearchQuery,
       filteredDockerContainers,
       openDockerDialog,
+      fetchDockerContainers,
       handleDockerImport,
       luckyDialogVisible,
       isLuckyLoading,
       luckyProxies,
       luckySearchQuery,
+      luckyShowAll,
+      luckyStatusLabels,
+      fetchLuckyProxies,
       filteredLuckyProxies,
       openLuckyDialog,
       handleLuckyImport,
+      dockerSelection,
+      luckySelection,
+      importGroup,
+      isImporting,
+      importProgress,
+      importDockerSelection,
+      importLuckySelection,
+      handleDockerSelectionChange,
+      handleLuckySelectionChange,
       backgroundDialogVisible,
       isSavingBackground,
       isUploadingBackground,
       backgroundForm,
       backgroundFileInput,
       backgroundList,
+      backgroundNextCursor,
+      backgroundSearchQuery,
+      isLoadingBackgrounds,
+      fetchBackgrounds,
+      loadMoreBackgrounds,
       openBackgroundDialog,
       selectBackgroundImage,
       handleBackgroundFileUpload,
       submitBackgroundSettings,
       blurOptions,
+      serviceStatus,
+      watchServiceStatus,
+      statusClass,
+      statusTitle,
       Edit,
       Delete,
       Plus,